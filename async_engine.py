@@ -0,0 +1,38 @@
+import asyncio
+
+
+async def drive_workflow_async(workflow, acomplete):
+    # Same protocol as run_workflow in generate_tickets: the workflow yields
+    # chat completion requests and receives the completion text back. A list
+    # of sibling requests is issued concurrently and answered with the list
+    # of their texts.
+    try:
+        request = next(workflow)
+        while True:
+            if isinstance(request, list):
+                reply = list(await asyncio.gather(*(acomplete(item) for item in request)))
+            else:
+                reply = await acomplete(request)
+            request = workflow.send(reply)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_workflows_async(workflows, acomplete, concurrency=100, on_done=None):
+    # Each workflow waits for its answers before going on; up to `concurrency`
+    # of them are in flight at once. `workflows` may be a lazy iterable. Results are
+    # returned in its order, unless on_done is given, in which case they are
+    # only passed to it.
+    results = {}
+    pending = iter(enumerate(workflows))
+
+    async def worker():
+        for index, workflow in pending:
+            result = await drive_workflow_async(workflow, acomplete)
+            if on_done is not None:
+                on_done(index, result)
+            else:
+                results[index] = result
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return [results[index] for index in sorted(results)]
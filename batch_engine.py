@@ -0,0 +1,178 @@
+import json
+import os
+import time
+
+
+def write_batch_file(path, items):
+    with open(path, 'w', encoding='utf-8') as f:
+        for custom_id, request in items:
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": request["params"]
+            }, ensure_ascii=False) + "\n")
+
+
+def read_batch_results(path):
+    # Returns {custom_id: response body} for the successful lines of a batch output file
+    results = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                continue
+            results[record["custom_id"]] = response["body"]
+    return results
+
+
+def body_content(body):
+    return body["choices"][0]["message"]["content"]
+
+
+def custom_ids(index, request):
+    # Batch line IDs of a workflow's request; sibling requests get "<index>.<n>"
+    if isinstance(request, list):
+        return [f"{index}.{n}" for n in range(len(request))]
+    return [str(index)]
+
+
+def openai_batch_submitter(client, poll_interval=30):
+    # Uploads the wave, runs it through the Batch API and downloads the output file
+    def submit(input_path, output_path):
+        with open(input_path, 'rb') as f:
+            batch_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(poll_interval)
+            batch = client.batches.retrieve(batch.id)
+        if not batch.output_file_id:
+            raise RuntimeError(f"Batch {batch.id} ended with status {batch.status} and no output")
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(client.files.content(batch.output_file_id).text)
+    return submit
+
+
+def local_batch_submitter(complete):
+    # File-based stand-in for the Batch API: reads the input JSONL, answers
+    # every line with `complete`, which returns the chat completion response
+    # body, and writes an output file in the same format.
+    def submit(input_path, output_path):
+        with open(input_path, encoding='utf-8') as fin, open(output_path, 'w', encoding='utf-8') as fout:
+            for n, line in enumerate(fin):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                fout.write(json.dumps({
+                    "id": f"batch_req_{n}",
+                    "custom_id": record["custom_id"],
+                    "response": {"status_code": 200, "body": complete(record["body"])},
+                    "error": None
+                }, ensure_ascii=False) + "\n")
+    return submit
+
+
+def run_workflows_in_batches(workflows, submit, batch_dir, on_done=None, max_attempts=3, cache=None, record=None):
+    # Advances every workflow by one request per wave. Each wave is written as
+    # one JSONL batch, submitted, and its results are sent back into the
+    # workflows before the next wave is built. Sibling requests yielded as a
+    # list go into the same wave, and the workflow gets the list of their
+    # texts once all are answered. Failed lines are retried in the following
+    # wave. Requests answered by `cache` never reach a batch file. Workflows
+    # yield requests whose "params" are the chat completion body. Every
+    # answer is passed to record(request, body, seconds) with the yielded
+    # request, the batch response body (None for cache hits) and how long
+    # the request waited for its wave.
+    os.makedirs(batch_dir, exist_ok=True)
+    results = [None] * len(workflows)
+    pending = {}
+    answers = {}
+    attempts = {}
+
+    def advance(index, reply):
+        try:
+            if reply is None:
+                pending[index] = next(workflows[index])
+            else:
+                pending[index] = workflows[index].send(reply)
+            answers[index] = {}
+            attempts[index] = 0
+        except StopIteration as stop:
+            pending.pop(index, None)
+            if on_done is not None:
+                on_done(index, stop.value)
+            else:
+                results[index] = stop.value
+
+    def unanswered():
+        items = []
+        for index, request in pending.items():
+            requests = request if isinstance(request, list) else [request]
+            for custom_id, item in zip(custom_ids(index, request), requests):
+                if custom_id not in answers[index]:
+                    items.append((index, custom_id, item))
+        return items
+
+    def advance_answered(indexes):
+        # Sends the replies of the workflows whose requests are all answered
+        for index in indexes:
+            ids = custom_ids(index, pending[index])
+            if all(custom_id in answers[index] for custom_id in ids):
+                replies = [answers[index][custom_id] for custom_id in ids]
+                advance(index, replies if isinstance(pending[index], list) else replies[0])
+
+    def answer_from_cache():
+        answered = True
+        while answered:
+            answered = set()
+            for index, custom_id, item in unanswered():
+                content = cache.get(item["params"])
+                if content is not None:
+                    if record is not None:
+                        record(item, None, 0.0)
+                    answers[index][custom_id] = content
+                    answered.add(index)
+            advance_answered(sorted(answered))
+
+    for index in range(len(workflows)):
+        advance(index, None)
+    if cache is not None:
+        answer_from_cache()
+
+    wave = 0
+    while pending:
+        wave += 1
+        input_path = os.path.join(batch_dir, f"wave-{wave:03d}-input.jsonl")
+        output_path = os.path.join(batch_dir, f"wave-{wave:03d}-output.jsonl")
+        items = unanswered()
+        write_batch_file(input_path, [(custom_id, item) for _, custom_id, item in items])
+        print(f"Submitting batch wave {wave} with {len(items)} requests...")
+        started = time.perf_counter()
+        submit(input_path, output_path)
+        seconds = time.perf_counter() - started
+        replies = read_batch_results(output_path)
+        for index, custom_id, item in items:
+            if custom_id in replies:
+                content = body_content(replies[custom_id])
+                if record is not None:
+                    record(item, replies[custom_id], seconds)
+                if cache is not None:
+                    cache.put(item["params"], content)
+                answers[index][custom_id] = content
+        waiting = sorted({index for index, _, _ in items})
+        for index in waiting:
+            if any(custom_id not in answers[index] for custom_id in custom_ids(index, pending[index])):
+                attempts[index] += 1
+                if attempts[index] >= max_attempts:
+                    raise RuntimeError(f"Request {index} failed in {max_attempts} consecutive batch waves")
+        advance_answered(waiting)
+        if cache is not None:
+            answer_from_cache()
+    return results
@@ -0,0 +1,69 @@
+import argparse
+import random
+import time
+
+import generate_tickets as gt
+from telemetry import PRICES, estimate_cost
+
+# What can be compared: the generate_tickets setting and its values, baseline first
+COMPARISONS = {
+    "generation": ("generation_mode", ("per-stage", "whole-ticket")),
+    "prompt-layout": ("prompt_layout", ("legacy", "prefix"))
+}
+
+
+def run_mode(mode, args):
+    setattr(gt, COMPARISONS[args.compare][0], mode)
+    for key in gt.usage_totals:
+        gt.usage_totals[key] = 0
+    random.seed(args.seed)
+    specs = []
+    counts = gt.allocate_counts(args.tickets, [info["weight"] for info in gt.categories.values()])
+    for category_code, num_tickets in zip(gt.categories, counts):
+        ticket_dates = gt.generate_ticket_dates(num_tickets, gt.start_date, gt.end_date)
+        specs.extend(gt.create_ticket_specs(category_code, ticket_dates, args.seed))
+    tickets = []
+    started = time.perf_counter()
+    gt.engine_runner(args)(specs, lambda index, ticket: tickets.append(ticket))
+    elapsed = time.perf_counter() - started
+    cost = estimate_cost(
+        args.model, gt.usage_totals["prompt_tokens"], gt.usage_totals["completion_tokens"], gt.usage_totals["cached_tokens"]
+    )
+    return {
+        "mode": mode,
+        "tickets": len(tickets),
+        "seconds": elapsed,
+        "tickets_per_minute": len(tickets) / elapsed * 60 if elapsed else 0.0,
+        "calls_per_ticket": gt.usage_totals["calls"] / len(tickets),
+        "prompt_tokens_per_ticket": gt.usage_totals["prompt_tokens"] / len(tickets),
+        "completion_tokens_per_ticket": gt.usage_totals["completion_tokens"] / len(tickets),
+        "cached_ratio": gt.usage_totals["cached_tokens"] / gt.usage_totals["prompt_tokens"] if gt.usage_totals["prompt_tokens"] else 0.0,
+        "cost_per_ticket": cost / len(tickets),
+        "status_entries_per_ticket": sum(len(t["Status History"]) for t in tickets) / len(tickets)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the per-stage and whole-ticket generation modes, or the legacy and prefix-cached prompt layouts."
+    )
+    parser.add_argument("--compare", choices=sorted(COMPARISONS), default="generation")
+    parser.add_argument("--tickets", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=["sequential", "async"], default="async")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--model", default="gpt-4o-mini", choices=sorted(PRICES))
+    args = parser.parse_args()
+    for mode in COMPARISONS[args.compare][1]:
+        result = run_mode(mode, args)
+        print(
+            f"{result['mode']:>12}: {result['tickets']} tickets in {result['seconds']:.1f}s, "
+            f"{result['tickets_per_minute']:.1f} tickets/min, {result['calls_per_ticket']:.1f} calls/ticket, "
+            f"{result['prompt_tokens_per_ticket']:.0f}+{result['completion_tokens_per_ticket']:.0f} tokens/ticket "
+            f"({result['cached_ratio']:.0%} of prompt cached), "
+            f"${result['cost_per_ticket']:.5f}/ticket, {result['status_entries_per_ticket']:.1f} statuses/ticket"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from openai import OpenAI, AsyncOpenAI
+
+# generate_tickets builds its default clients on import; they are replaced by
+# clients of the mock server for every scenario
+os.environ.setdefault("OPENAI_API_KEY", "mock")
+import generate_tickets as gt
+from mock_openai_server import start_server
+from rate_limiter import RateLimitScheduler
+from telemetry import estimate_cost, percentile
+
+# Workflow shapes, as generate_tickets.py options
+SHAPES = {
+    "per-stage": {},
+    "structured": {"classifier": "structured"},
+    "piggyback": {"classifier": "piggyback"},
+    "whole-ticket": {"generation": "whole-ticket"},
+    "budgeted": {"context-budget": 600},
+    "legacy-prompts": {"prompt-layout": "legacy"},
+    "chained-stages": {"stages": "chain"}
+}
+
+
+def whole_ticket_responder(body, rng):
+    # The mock answers schemas generically; whole tickets get a history that
+    # passes validate_status_history so the benchmark measures the happy path
+    response_format = body.get("response_format") or {}
+    if "status_history" not in response_format.get("json_schema", {}).get("schema", {}).get("properties", {}):
+        return None
+    num_actions = rng.randint(1, 5)
+    history = []
+    for status_info in gt.ticket_status_steps_prompts:
+        if status_info["type"] == "optional" and rng.random() < 0.5:
+            continue
+        count = rng.randint(1, 3) if status_info["recurrence"] == "many" else 1
+        history.extend({"status": status_info["status"], "comment": "- mock comment"} for _ in range(count))
+        if status_info["status"] in gt.per_action_statuses:
+            history.extend(
+                {"status": f"{status_info['status']} - Action {j+1}", "comment": "- mock action"}
+                for j in range(num_actions)
+            )
+    return json.dumps({"description": "- mock description", "status_history": history})
+
+
+def timed_workflow(workflow, latencies, call_latencies):
+    # Measures a ticket from its first request to its last answer, and each
+    # request (or group of sibling requests) until it is answered
+    started = time.perf_counter()
+    try:
+        request = next(workflow)
+        while True:
+            sent = time.perf_counter()
+            reply = yield request
+            call_latencies.append(time.perf_counter() - sent)
+            request = workflow.send(reply)
+    except StopIteration as stop:
+        latencies.append(time.perf_counter() - started)
+        return stop.value
+
+
+def scenario_argv(tickets, concurrency, shape, seed, endpoints_path=None, hedge_percentile=0):
+    argv = ["--total-tickets", str(tickets), "--seed", str(seed)]
+    argv += ["--engine", "sequential"] if concurrency == 1 else ["--engine", "async", "--concurrency", str(concurrency)]
+    for option, value in SHAPES[shape].items():
+        argv += [f"--{option}", str(value)]
+    if endpoints_path:
+        argv += ["--endpoints", endpoints_path, "--hedge-percentile", str(hedge_percentile)]
+    return argv
+
+
+def run_generate_tickets(tickets, shape, seed):
+    # The legacy entry point: one category after the other, one ticket at a time
+    options = SHAPES[shape]
+    gt.generation_mode = options.get("generation", "per-stage")
+    gt.classifier_mode = options.get("classifier", "separate")
+    gt.context_budget = options.get("context-budget")
+    gt.prompt_layout = options.get("prompt-layout", "prefix")
+    gt.stage_schedule = options.get("stages", "dag")
+    gt.text_backend = None
+    gt.response_cache = None
+    gt.rate_limiter = RateLimitScheduler(max_concurrency=1)
+    gt.random.seed(seed)
+    counts = gt.allocate_counts(tickets, [info["weight"] for info in gt.categories.values()])
+    for (category_code, category_info), num_tickets in zip(gt.categories.items(), counts):
+        ticket_dates = gt.generate_ticket_dates(num_tickets, gt.start_date, gt.end_date)
+        gt.generate_tickets(category_code, category_info, ticket_dates)
+
+
+def run_scenario(entry, tickets, concurrency, shape, seed, servers, endpoints_path=None, hedge_percentile=0):
+    # With endpoints_path, main() spreads the calls over every mock server in
+    # `servers` through an endpoint pool; otherwise only the first one is used
+    for totals in (gt.usage_totals, gt.context_totals):
+        for key in totals:
+            totals[key] = 0
+    gt.client = OpenAI(base_url=servers[0].base_url, api_key="mock")
+    gt.async_client = AsyncOpenAI(base_url=servers[0].base_url, api_key="mock")
+    gt.endpoint_pool = None
+    # Forget the prompt prefixes earlier scenarios left in the servers' caches
+    for server in servers:
+        with server.state.lock:
+            server.state.prefixes.clear()
+    counts_before = [dict(server.state.counts) for server in servers]
+    latencies = []
+    call_latencies = []
+    start_workflow = gt.start_workflow
+    gt.start_workflow = lambda spec: timed_workflow(start_workflow(spec), latencies, call_latencies)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as workdir, open(os.devnull, 'w') as devnull:
+            os.chdir(workdir)
+            with contextlib.redirect_stdout(devnull):
+                started = time.perf_counter()
+                if entry == "main":
+                    gt.main(scenario_argv(tickets, concurrency, shape, seed, endpoints_path, hedge_percentile))
+                else:
+                    run_generate_tickets(tickets, shape, seed)
+                elapsed = time.perf_counter() - started
+    finally:
+        gt.start_workflow = start_workflow
+        gt.client.close()
+        os.chdir(cwd)
+    done = len(latencies)
+    server_counts = {
+        key: sum(server.state.counts[key] - before[key] for server, before in zip(servers, counts_before))
+        for key in counts_before[0]
+    }
+    return {
+        "entry": entry,
+        "shape": shape,
+        "tickets": tickets,
+        "concurrency": concurrency,
+        "endpoints": len(servers) if endpoints_path else 0,
+        "hedge_percentile": hedge_percentile if endpoints_path else 0,
+        "seconds": elapsed,
+        "tickets_per_second": done / elapsed if elapsed else 0.0,
+        "calls_per_ticket": gt.usage_totals["calls"] / done,
+        "prompt_tokens_per_ticket": gt.usage_totals["prompt_tokens"] / done,
+        "completion_tokens_per_ticket": gt.usage_totals["completion_tokens"] / done,
+        "cached_tokens_per_ticket": gt.usage_totals["cached_tokens"] / done,
+        "cached_ratio": gt.usage_totals["cached_tokens"] / gt.usage_totals["prompt_tokens"] if gt.usage_totals["prompt_tokens"] else 0.0,
+        "cost_per_ticket": estimate_cost(
+            "gpt-4o-mini", gt.usage_totals["prompt_tokens"], gt.usage_totals["completion_tokens"], gt.usage_totals["cached_tokens"]
+        ) / done,
+        "ticket_latency_p50": percentile(latencies, 50),
+        "ticket_latency_p95": percentile(latencies, 95),
+        "ticket_latency_p99": percentile(latencies, 99),
+        "call_latency_p50": percentile(call_latencies, 50),
+        "call_latency_p99": percentile(call_latencies, 99),
+        "http_requests": server_counts["requests"],
+        "rate_limited": server_counts["rate_limited"],
+        "server_errors": server_counts["server_errors"],
+        "slow_requests": server_counts["slow"]
+    }
+
+
+def scenario_key(result):
+    # Results files from before endpoint pools have no endpoints/hedging fields
+    return (result["entry"], result["shape"], result["tickets"], result["concurrency"],
+            result.get("endpoints", 0), result.get("hedge_percentile", 0))
+
+
+def compare(results, baseline_path, threshold):
+    # Prints the tickets/s change against a previous results file; returns
+    # the number of scenarios slower by more than `threshold`
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {scenario_key(result): result for result in json.load(f)["results"]}
+    regressions = 0
+    for result in results:
+        previous = baseline.get(scenario_key(result))
+        if previous is None or not previous["tickets_per_second"]:
+            continue
+        change = result["tickets_per_second"] / previous["tickets_per_second"] - 1
+        flag = ""
+        if change < -threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{'/'.join(map(str, scenario_key(result)))}: {previous['tickets_per_second']:.2f} -> "
+              f"{result['tickets_per_second']:.2f} tickets/s ({change:+.0%}){flag}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ticket generation against a local mock of the OpenAI API.")
+    parser.add_argument("--tickets", type=int, nargs="+", default=[20, 100], help="total_tickets values to run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64],
+                        help="Concurrency levels; 1 runs the sequential engine, more the async engine")
+    parser.add_argument("--shapes", nargs="+", choices=sorted(SHAPES), default=["per-stage", "structured", "whole-ticket"])
+    parser.add_argument("--entries", nargs="+", choices=["main", "generate_tickets"], default=["main"],
+                        help="Drive main() or the legacy generate_tickets() function (sequential only)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Median latency of the mock server")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of the latency")
+    parser.add_argument("--rate-limit-error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of requests delayed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=0.0, help="Extra latency of the delayed requests")
+    parser.add_argument("--endpoints", type=int, default=0,
+                        help="Spread calls over this many mock servers through an endpoint pool (0: one plain client)")
+    parser.add_argument("--hedge-percentiles", type=float, nargs="+", default=[0, 95],
+                        help="Hedging thresholds to run with --endpoints; 0 runs the pool without hedging")
+    parser.add_argument("--out", default=None, help="Results file (default benchmarks/<timestamp>-<revision>.json)")
+    parser.add_argument("--compare", default=None, metavar="PATH", help="Previous results file to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=0.1,
+                        help="Relative tickets/s drop reported as a regression")
+    args = parser.parse_args()
+
+    server_config = {
+        "latency_ms": args.latency_ms,
+        "latency_sigma": args.latency_sigma,
+        "rate_limit_error_rate": args.rate_limit_error_rate,
+        "server_error_rate": args.server_error_rate,
+        "slow_rate": args.slow_rate,
+        "slow_ms": args.slow_ms
+    }
+    servers = []
+    for n in range(max(1, args.endpoints)):
+        # Every server has its own stragglers
+        server, base_url = start_server(responder=whole_ticket_responder, seed=args.seed + n, **server_config)
+        server.base_url = base_url
+        servers.append(server)
+    endpoints_path = None
+    hedge_percentiles = [0]
+    if args.endpoints:
+        endpoints_path = os.path.join(tempfile.gettempdir(), f"benchmark-endpoints-{os.getpid()}.json")
+        with open(endpoints_path, 'w', encoding='utf-8') as f:
+            json.dump([
+                {"name": f"mock-{n}", "base_url": server.base_url, "api_key": "mock"}
+                for n, server in enumerate(servers)
+            ], f)
+        hedge_percentiles = args.hedge_percentiles
+    results = []
+    try:
+        for entry, shape, tickets, concurrency, hedge in itertools.product(
+                args.entries, args.shapes, args.tickets, args.concurrency, hedge_percentiles):
+            if entry == "generate_tickets" and (concurrency != 1 or endpoints_path):
+                continue
+            result = run_scenario(entry, tickets, concurrency, shape, args.seed, servers, endpoints_path, hedge)
+            results.append(result)
+            pool = f"/{args.endpoints} endpoints/hedge p{hedge:g}" if endpoints_path else ""
+            print(
+                f"{entry}/{shape}/{tickets} tickets/concurrency {concurrency}{pool}: "
+                f"{result['tickets_per_second']:.2f} tickets/s, {result['calls_per_ticket']:.1f} calls/ticket, "
+                f"{result['prompt_tokens_per_ticket']:.0f}+{result['completion_tokens_per_ticket']:.0f} tokens/ticket "
+                f"({result['cached_ratio']:.0%} of prompt cached), ${result['cost_per_ticket']:.5f}/ticket, latency p50/p95/p99 {result['ticket_latency_p50']:.2f}/{result['ticket_latency_p95']:.2f}/"
+                f"{result['ticket_latency_p99']:.2f}s, call p50/p99 {result['call_latency_p50']:.2f}/"
+                f"{result['call_latency_p99']:.2f}s"
+            )
+    finally:
+        for server in servers:
+            server.shutdown()
+        if endpoints_path:
+            os.remove(endpoints_path)
+
+    revision = git_revision()
+    timestamp = datetime.now(timezone.utc)
+    out = args.out
+    if out is None:
+        os.makedirs("benchmarks", exist_ok=True)
+        out = os.path.join("benchmarks", f"{timestamp:%Y%m%dT%H%M%S}-{revision or 'unknown'}.json")
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump({
+            "revision": revision,
+            "timestamp": timestamp.isoformat(),
+            "server": dict(server_config, seed=args.seed, endpoints=args.endpoints),
+            "results": results
+        }, f, indent=4)
+    print(f"Results saved to '{out}'")
+    if args.compare:
+        regressions = compare(results, args.compare, args.regression_threshold)
+        if regressions:
+            raise SystemExit(f"{regressions} scenario(s) regressed by more than {args.regression_threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import os
+from datetime import date
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed for --columnar
+    pa = None
+
+from output_writers import iter_tickets_in_order
+
+# Normalized layout: one row per ticket, one row per status event. Category
+# and status repeat a handful of values and are dictionary-encoded.
+DICTIONARY_COLUMNS = ("category", "status")
+
+
+def tickets_schema():
+    return pa.schema([
+        ("ticket_id", pa.string()),
+        ("category", pa.dictionary(pa.int32(), pa.string())),
+        ("open_date", pa.date32()),
+        ("initial_description", pa.string()),
+        ("num_events", pa.int16())
+    ])
+
+
+def events_schema():
+    return pa.schema([
+        ("ticket_id", pa.string()),
+        ("seq", pa.int16()),
+        ("status", pa.dictionary(pa.int32(), pa.string())),
+        ("status_date", pa.date32()),
+        ("comment", pa.string())
+    ])
+
+
+class DictionaryColumn:
+    # Dictionary that only grows, so that every batch's dictionary extends the
+    # previous one (Arrow IPC files accept deltas but not replacements)
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def encode(self, values):
+        codes = []
+        for value in values:
+            code = self.index.get(value)
+            if code is None:
+                code = self.index[value] = len(self.values)
+                self.values.append(value)
+            codes.append(code)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(codes, type=pa.int32()), pa.array(self.values, type=pa.string())
+        )
+
+
+class TableWriter:
+    # Buffers rows column by column and writes one row group (Parquet) or
+    # record batch (Arrow IPC file) every `row_group_size` rows
+
+    def __init__(self, path, schema, fmt, row_group_size):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.columns = {name: [] for name in schema.names}
+        self.dictionaries = {name: DictionaryColumn() for name in schema.names if name in DICTIONARY_COLUMNS}
+        self.rows = 0
+        if fmt == "parquet":
+            self.writer = pq.ParquetWriter(
+                self.tmp_path, schema, compression="zstd", use_dictionary=list(self.dictionaries)
+            )
+        else:
+            self.sink = pa.OSFile(self.tmp_path, 'wb')
+            self.writer = pa.ipc.new_file(
+                self.sink, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            )
+
+    def append(self, row):
+        for name, value in zip(self.schema.names, row):
+            self.columns[name].append(value)
+        self.rows += 1
+        if self.rows == self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        arrays = []
+        for field in self.schema:
+            values = self.columns[field.name]
+            if field.name in self.dictionaries:
+                arrays.append(self.dictionaries[field.name].encode(values))
+            else:
+                arrays.append(pa.array(values, type=field.type))
+            values.clear()
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        if hasattr(self, "sink"):
+            self.sink.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def export_columnar(jsonl_paths, ticket_ids, tickets_path, events_path, fmt="parquet", row_group_size=65536):
+    # Streams the JSONL log(s) into a tickets table and a status events table,
+    # in `ticket_ids` order, one row group of `row_group_size` rows at a time
+    if pa is None:
+        raise RuntimeError("pyarrow is required for the columnar export (pip install pyarrow)")
+    tickets = TableWriter(tickets_path, tickets_schema(), fmt, row_group_size)
+    events = TableWriter(events_path, events_schema(), fmt, row_group_size)
+    count = 0
+    for ticket in iter_tickets_in_order(jsonl_paths, ticket_ids):
+        history = ticket["Status History"]
+        tickets.append((
+            ticket["Ticket ID"], ticket["Category"], date.fromisoformat(ticket["Open Date"]),
+            ticket["Initial Description"], len(history)
+        ))
+        for seq, status in enumerate(history):
+            events.append((
+                ticket["Ticket ID"], seq, status["Status"], date.fromisoformat(status["Date"]), status["Comment"]
+            ))
+        count += 1
+    tickets.close()
+    events.close()
+    return count
+
+
+def columnar_paths(fmt, stem='non_conformities'):
+    extension = "parquet" if fmt == "parquet" else "arrow"
+    return f"{stem}.tickets.{extension}", f"{stem}.events.{extension}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a JSONL ticket log to normalized Parquet or Arrow tables.")
+    parser.add_argument("jsonl", nargs="+", help="JSONL log(s) written by generate_tickets.py")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--row-group-size", type=int, default=65536, help="Rows per row group / record batch")
+    parser.add_argument("--stem", default="non_conformities", help="Output file name prefix")
+    args = parser.parse_args()
+    tickets_path, events_path = columnar_paths(args.format, args.stem)
+    count = export_columnar(args.jsonl, [], tickets_path, events_path, args.format, args.row_group_size)
+    print(f"Exported {count} tickets to '{tickets_path}' and '{events_path}'")
+
+
+if __name__ == "__main__":
+    main()
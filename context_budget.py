@@ -0,0 +1,115 @@
+try:
+    import tiktoken
+except ImportError:  # optional, falls back to an approximate count
+    tiktoken = None
+
+_encoding = None
+
+# Starts the line that stands for the folded comments in CommentContext.lines()
+SUMMARY_PREFIX = "Summary of earlier comments: "
+
+
+def count_tokens(text):
+    # Local token count with the gpt-4o family encoding, or ~4 characters per
+    # token when tiktoken or its encoding file is not available.
+    global _encoding
+    if _encoding is None:
+        _encoding = False
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                print("tiktoken encoding unavailable, approximating token counts")
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+class CommentContext:
+    # History of a ticket's comments as seen by the prompts. Without a budget
+    # every comment is sent verbatim. With a budget the most recent comments
+    # stay verbatim and older ones are folded into a rolling summary that is
+    # updated by the model, a few comments at a time.
+
+    def __init__(self, budget=None, keep_recent=2):
+        self.budget = budget
+        self.keep_recent = max(1, keep_recent)
+        self.summary = ""
+        self.summary_tokens = 0
+        self.recent = []
+        self.recent_tokens = []
+        self.history_tokens = 0
+        # Tokens of history sent across all prompts, verbatim vs budgeted
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def append(self, comment):
+        tokens = count_tokens(comment) if self.budget is not None else 0
+        self.recent.append(comment)
+        self.recent_tokens.append(tokens)
+        self.history_tokens += tokens
+
+    def lines(self):
+        if self.budget is not None:
+            self.tokens_before += self.history_tokens
+            self.tokens_after += self.summary_tokens + sum(self.recent_tokens)
+        if self.summary:
+            return [SUMMARY_PREFIX + self.summary] + self.recent
+        return list(self.recent)
+
+    def summary_cap(self):
+        return max(16, self.budget // 4)
+
+    def needs_fold(self):
+        return (
+            self.budget is not None
+            and len(self.recent) > self.keep_recent
+            and self.summary_tokens + sum(self.recent_tokens) > self.budget
+        )
+
+    def fold_request(self):
+        # Fold the oldest verbatim comments until the rest fits next to a full summary
+        limit = self.budget - self.summary_cap()
+        folded = 0
+        remaining = sum(self.recent_tokens)
+        while len(self.recent) - folded > self.keep_recent and (folded == 0 or remaining > limit):
+            remaining -= self.recent_tokens[folded]
+            folded += 1
+        prompt = (
+            f"You maintain a running summary of a non-conformity ticket's comment history.\n"
+            f"Current summary:\n{self.summary or '(none)'}\n"
+            f"New comments to fold in:\n"
+            f"{'-'*20}\n"
+            f"{chr(10).join(self.recent[:folded])}\n"
+            f"{'-'*20}\n"
+            f"Return the updated summary only, keeping key findings, decisions, figures and actions, "
+            f"telegraphic-synthetic and minimalistic style with bullet points, "
+            f"in at most {self.summary_cap() * 3 // 4} words."
+        )
+        request = {
+            "function": "summarize_history",
+            "tags": {},
+            "params": {
+                "model": "gpt-4o-mini",
+                "messages": [{
+                    "role": "user",
+                    "content": prompt,
+                }],
+                "max_tokens": self.summary_cap(),
+                "temperature": 0
+            }
+        }
+        return request, folded
+
+    def apply_fold(self, summary, folded):
+        self.summary = summary
+        self.summary_tokens = count_tokens(summary)
+        del self.recent[:folded]
+        del self.recent_tokens[:folded]
+
+
+def compact_context(context):
+    # Sub-workflow: yields summary requests until the context fits its budget
+    while context.needs_fold():
+        request, folded = context.fold_request()
+        context.apply_fold((yield request).strip(), folded)
@@ -0,0 +1,352 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import openai
+
+from rate_limiter import TokenBucket, estimate_tokens, observe_rate_headers, settle_usage
+from telemetry import percentile
+
+try:
+    import httpx
+except ImportError:  # installed with openai; without it each client keeps its default pool
+    httpx = None
+
+# Spreads chat completions over several OpenAI-compatible endpoints, e.g. the
+# public API next to self-hosted vLLM or llama.cpp servers. Endpoints come
+# from a JSON file:
+#   [{"name": "openai", "api_key_env": "OPENAI_API_KEY"},
+#    {"name": "vllm", "base_url": "http://gpu-1:8000/v1", "api_key": "none",
+#     "model": "meta-llama/Llama-3.1-8B-Instruct", "max_connections": 64}]
+# "model" replaces the requested model on that endpoint, "weight" skews the
+# share of calls it gets, "rpm" and "tpm" set its rate limits (otherwise
+# learned from its x-ratelimit-* headers). Every endpoint has its own clients,
+# HTTP connection pool and rate-limit buckets.
+
+# Recent latencies kept per endpoint, and how many are needed before hedging
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+# Consecutive connection errors, timeouts or 5xx before an endpoint is taken
+# out of rotation until a health check succeeds
+FAILURES_BEFORE_DOWN = 3
+
+# Errors that say something about the endpoint rather than the request
+ENDPOINT_ERRORS = (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def load_endpoints(path):
+    with open(path, encoding='utf-8') as f:
+        endpoints = json.load(f)
+    if not isinstance(endpoints, list) or not endpoints:
+        raise ValueError(f"{path}: expected a non-empty list of endpoints")
+    return endpoints
+
+
+class Endpoint:
+
+    def __init__(self, name, base_url=None, api_key=None, api_key_env=None, model=None, weight=1.0,
+                 max_connections=100, timeout=600.0, rpm=None, tpm=None):
+        self.name = name
+        self.model = model
+        self.weight = float(weight)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.configured = (rpm, tpm)
+        options = {
+            "base_url": base_url,
+            "api_key": api_key or os.getenv(api_key_env or "OPENAI_API_KEY") or "none",
+            "max_retries": 0,
+            "timeout": timeout
+        }
+        self.options = options
+        self.limits = None
+        if httpx is not None:
+            self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            self.client = openai.OpenAI(http_client=openai.DefaultHttpxClient(limits=self.limits), **options)
+        else:
+            self.client = openai.OpenAI(**options)
+        # Async connections belong to an event loop: built on first use and
+        # closed by EndpointPool.aclose before the loop ends
+        self.async_client = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.in_flight = 0
+        self.failures = 0
+        self.healthy = True
+        self.stats = {"calls": 0, "failures": 0, "hedges": 0, "hedge_wins": 0}
+
+    def aclient(self):
+        if self.async_client is None:
+            if self.limits is not None:
+                http_client = openai.DefaultAsyncHttpxClient(limits=self.limits)
+                self.async_client = openai.AsyncOpenAI(http_client=http_client, **self.options)
+            else:
+                self.async_client = openai.AsyncOpenAI(**self.options)
+        return self.async_client
+
+
+class EndpointPool:
+    # Sends each call to the healthy endpoint with the fewest calls in flight
+    # per unit of weight. A call still unanswered after the endpoint's
+    # `hedge_percentile` latency is duplicated on another endpoint and the
+    # first response wins (at most `max_hedge_ratio` of calls are hedged). A
+    # call failing with an endpoint error is retried once elsewhere. Health
+    # checks list the models of every endpoint each `health_interval` seconds.
+    # Every call placed on an endpoint, hedges and retries included, is paced
+    # by that endpoint's buckets. create and acreate stand in for a
+    # with_raw_response create method, so the pool slots under a
+    # RateLimitScheduler built with learn_limits=False; served["endpoint"]
+    # tells which endpoint answered.
+
+    def __init__(self, endpoints, hedge_percentile=95, max_hedge_ratio=0.1, health_interval=30.0):
+        self.config = endpoints
+        self.endpoints = [Endpoint(**endpoint) for endpoint in endpoints]
+        self.swaps_model = any(endpoint.model for endpoint in self.endpoints)
+        self.hedge_percentile = hedge_percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.health_interval = health_interval
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.executor = None
+        self.closed = threading.Event()
+        if health_interval:
+            threading.Thread(target=self.health_loop, daemon=True).start()
+
+    def health_loop(self):
+        while True:
+            self.check_health()
+            if self.closed.wait(self.health_interval):
+                return
+
+    def check_health(self):
+        for endpoint in self.endpoints:
+            if self.closed.is_set():
+                return
+            try:
+                endpoint.client.with_options(timeout=10.0).models.list()
+            except Exception:
+                healthy = False
+            else:
+                healthy = True
+            with self.lock:
+                if healthy:
+                    endpoint.failures = 0
+                elif endpoint.healthy:
+                    print(f"Endpoint {endpoint.name} failed its health check, taken out of rotation")
+                endpoint.healthy = healthy
+
+    def pick(self, exclude=None):
+        # Reserves a slot on the chosen endpoint; released by send/asend
+        with self.lock:
+            candidates = [e for e in self.endpoints if e is not exclude and e.healthy]
+            if not candidates:
+                # Every other endpoint is down: better try one than fail outright
+                candidates = [e for e in self.endpoints if e is not exclude] or self.endpoints
+            endpoint = min(candidates, key=lambda e: (
+                (e.in_flight + 1) / e.weight,
+                percentile(e.latencies, 50) if e.latencies else 0.0
+            ))
+            endpoint.in_flight += 1
+        return endpoint
+
+    def hedge_delay(self, endpoint):
+        if not self.hedge_percentile:
+            return None
+        with self.lock:
+            if len(endpoint.latencies) < MIN_SAMPLES:
+                return None
+            return percentile(endpoint.latencies, self.hedge_percentile)
+
+    def start_call(self):
+        with self.lock:
+            self.calls += 1
+
+    def take_hedge(self, endpoint):
+        with self.lock:
+            if self.hedges >= self.max_hedge_ratio * self.calls:
+                return False
+            self.hedges += 1
+            endpoint.stats["hedges"] += 1
+            return True
+
+    def finished(self, endpoint, seconds=None, error=None):
+        with self.lock:
+            endpoint.in_flight -= 1
+            if seconds is not None:
+                endpoint.stats["calls"] += 1
+                endpoint.failures = 0
+                endpoint.latencies.append(seconds)
+            elif isinstance(error, ENDPOINT_ERRORS):
+                endpoint.stats["failures"] += 1
+                endpoint.failures += 1
+                if endpoint.failures >= FAILURES_BEFORE_DOWN and endpoint.healthy:
+                    endpoint.healthy = False
+                    print(f"Endpoint {endpoint.name} failed {endpoint.failures} calls in a row, taken out of rotation")
+
+    @staticmethod
+    def params_for(endpoint, params):
+        return dict(params, model=endpoint.model) if endpoint.model else params
+
+    def reserve(self, endpoint, params):
+        # Returns the token estimate and how long to wait before calling
+        estimate = estimate_tokens(params)
+        with self.lock:
+            return estimate, max(endpoint.requests.take(1), endpoint.tokens.take(estimate))
+
+    def observe(self, endpoint, raw, estimate):
+        response = raw.parse()
+        with self.lock:
+            observe_rate_headers(endpoint.requests, endpoint.tokens, endpoint.configured, raw.headers)
+            settle_usage(endpoint.tokens, response, estimate)
+
+    def send(self, endpoint, params):
+        estimate, delay = self.reserve(endpoint, params)
+        time.sleep(delay)
+        started = time.perf_counter()
+        try:
+            raw = endpoint.client.chat.completions.with_raw_response.create(**self.params_for(endpoint, params))
+        except Exception as error:
+            self.finished(endpoint, error=error)
+            raise
+        self.finished(endpoint, time.perf_counter() - started)
+        self.observe(endpoint, raw, estimate)
+        return raw
+
+    async def asend(self, endpoint, params):
+        estimate, delay = self.reserve(endpoint, params)
+        started = None
+        try:
+            await asyncio.sleep(delay)
+            started = time.perf_counter()
+            raw = await endpoint.aclient().chat.completions.with_raw_response.create(**self.params_for(endpoint, params))
+        except asyncio.CancelledError:
+            # Lost a hedge race: it took at least this long, which keeps the
+            # latency window from only remembering the winners
+            with self.lock:
+                endpoint.in_flight -= 1
+                if started is not None:
+                    endpoint.latencies.append(time.perf_counter() - started)
+            raise
+        except Exception as error:
+            self.finished(endpoint, error=error)
+            raise
+        self.finished(endpoint, time.perf_counter() - started)
+        self.observe(endpoint, raw, estimate)
+        return raw
+
+    def won(self, primary, endpoint, hedge, served):
+        if hedge:
+            with self.lock:
+                primary.stats["hedge_wins"] += 1
+        if served is not None:
+            served["endpoint"] = endpoint
+
+    def create(self, served=None, **params):
+        self.start_call()
+        primary = self.pick()
+        delay = self.hedge_delay(primary)
+        if delay is None:
+            endpoint = primary
+            try:
+                raw = self.send(primary, params)
+            except ENDPOINT_ERRORS:
+                if len(self.endpoints) == 1:
+                    raise
+                endpoint = self.pick(exclude=primary)
+                raw = self.send(endpoint, params)
+            self.won(primary, endpoint, False, served)
+            return raw
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="endpoint-pool")
+        # Losing duplicates cannot be interrupted; they finish in the background
+        # future -> (endpoint, whether it is a hedge)
+        futures = {self.executor.submit(self.send, primary, params): (primary, False)}
+        spare = True
+        error = None
+        while futures:
+            done, _ = wait(futures, timeout=delay if spare else None, return_when=FIRST_COMPLETED)
+            if not done:
+                # Slower than this endpoint's usual tail: hedge
+                spare = False
+                if self.take_hedge(primary):
+                    endpoint = self.pick(exclude=primary)
+                    futures[self.executor.submit(self.send, endpoint, params)] = (endpoint, True)
+                continue
+            for future in done:
+                endpoint, hedge = futures.pop(future)
+                if future.exception() is None:
+                    self.won(primary, endpoint, hedge, served)
+                    return future.result()
+                error = future.exception()
+            if not futures and spare and isinstance(error, ENDPOINT_ERRORS) and len(self.endpoints) > 1:
+                spare = False
+                endpoint = self.pick(exclude=primary)
+                futures[self.executor.submit(self.send, endpoint, params)] = (endpoint, False)
+        raise error
+
+    async def acreate(self, served=None, **params):
+        self.start_call()
+        primary = self.pick()
+        delay = self.hedge_delay(primary)
+        tasks = {asyncio.ensure_future(self.asend(primary, params)): (primary, False)}
+        spare = True
+        error = None
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, timeout=delay if spare else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than this endpoint's usual tail: hedge
+                    spare = False
+                    if self.take_hedge(primary):
+                        endpoint = self.pick(exclude=primary)
+                        tasks[asyncio.ensure_future(self.asend(endpoint, params))] = (endpoint, True)
+                    continue
+                for task in done:
+                    endpoint, hedge = tasks.pop(task)
+                    if task.exception() is None:
+                        self.won(primary, endpoint, hedge, served)
+                        return task.result()
+                    error = task.exception()
+                if not tasks and spare and isinstance(error, ENDPOINT_ERRORS) and len(self.endpoints) > 1:
+                    spare = False
+                    endpoint = self.pick(exclude=primary)
+                    tasks[asyncio.ensure_future(self.asend(endpoint, params))] = (endpoint, False)
+            raise error
+        finally:
+            # The slower duplicate is cancelled as soon as one response is in
+            for task in tasks:
+                task.cancel()
+
+    def summary(self):
+        lines = [f"Endpoint pool: {self.calls} calls, {self.hedges} hedged"]
+        with self.lock:
+            for endpoint in self.endpoints:
+                stats = endpoint.stats
+                latency = ""
+                if endpoint.latencies:
+                    latency = (f", latency p50/p99 {percentile(endpoint.latencies, 50):.2f}/"
+                               f"{percentile(endpoint.latencies, 99):.2f}s")
+                lines.append(
+                    f"  {endpoint.name}: {stats['calls']} responses, {stats['failures']} failures, "
+                    f"{stats['hedges']} hedges ({stats['hedge_wins']} won){latency}"
+                    f"{'' if endpoint.healthy else ', down'}"
+                )
+        return lines
+
+    async def aclose(self):
+        for endpoint in self.endpoints:
+            if endpoint.async_client is not None:
+                await endpoint.async_client.close()
+                endpoint.async_client = None
+
+    def close(self):
+        self.closed.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        for endpoint in self.endpoints:
+            endpoint.client.close()
@@ -1,16 +1,92 @@
 import random
 from datetime import datetime, timedelta
+import argparse
+import asyncio
 import json
 import csv
+import hashlib
+import multiprocessing
 import os
+import time
 import dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from openai.types import CompletionUsage
+from async_engine import run_workflows_async
+from llm_cache import ResponseCache
+from context_budget import CommentContext, compact_context, SUMMARY_PREFIX
+from scenario_planner import allocate_counts, plan_skeletons, load_skeletons, slot_statuses
+from text_backends import TemplateBackend, MarkovBackend, load_tickets
+from output_writers import CheckpointedTicketWriter, export_tickets_in_order, read_checkpoint, read_completion, read_run_info
+from rate_limiter import RateLimitScheduler
+from endpoint_pool import EndpointPool, load_endpoints
+from telemetry import Telemetry, usage_counts
+from prompt_builder import ChatPrompt
+from columnar_export import export_columnar, columnar_paths
+from viewer_bundle import build_viewer_bundle
+from batch_engine import run_workflows_in_batches, openai_batch_submitter, local_batch_submitter
 
 # Load environment variables
 dotenv.load_dotenv()
 OpenAI.api_key = os.getenv("OPENAI_API_KEY")
 
 client = OpenAI()
+async_client = AsyncOpenAI()
+
+# Local text backend replacing the OpenAI API (see text_backends.py), set up by main
+text_backend = None
+
+# Paces, adapts and retries API calls, set up by main (see rate_limiter.py)
+rate_limiter = None
+
+# Copies of the clients with their own retries turned off, for the chat
+# completions the scheduler retries (see without_retries)
+retryless_clients = {}
+
+# Optional pool of OpenAI-compatible endpoints with health checks and hedged
+# requests replacing the single client, set up by main (see endpoint_pool.py)
+endpoint_pool = None
+
+# Per-call latency, token and cost metrics, set up by main (see telemetry.py)
+telemetry = None
+
+# How comment and description prompts are laid out, set up by main: "prefix"
+# keeps each ticket's instructions and history as a stable, append-only
+# message prefix that the provider can cache, "legacy" is the original single
+# message with the stage role first
+prompt_layout = "prefix"
+
+# Dump every finished ticket to stdout, not just the progress line
+print_tickets = False
+
+# Optional persistent response cache, set up by main (see llm_cache.py)
+response_cache = None
+
+# Token budget for the comment history pasted into prompts (None sends it
+# verbatim) and how many recent comments always stay verbatim, set up by main
+context_budget = None
+context_keep_recent = 2
+context_totals = {"before": 0, "after": 0}
+
+# Which ticket workflow to run, set up by main: one request per stage, or the
+# whole ticket from one structured response
+generation_mode = "per-stage"
+
+# API calls and tokens used by this process (cache hits are not counted)
+usage_totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+
+# How complexity and action plan length are obtained, set up by main:
+# "separate" memoized classifier calls, one "structured" JSON call, or fields
+# "piggyback"ed on the Technical Analysis response
+classifier_mode = "separate"
+
+# How the stage graph is walked, set up by main: "dag" issues the steps whose
+# needs are met, and the repetitions of a step, together; "chain" writes one
+# comment at a time, each seeing every comment before it
+stage_schedule = "dag"
+
+# Range of ticket open dates
+start_date = datetime(2020, 1, 1)
+end_date = datetime(2024, 10, 31)
 
 # Define incident categories and possible labels
 categories = {
@@ -128,12 +204,17 @@ categories = {
     }
 }
 
-# Define the ticket status steps & prompts with enhanced instructions for realism
+# Define the ticket status steps & prompts with enhanced instructions for realism.
+# "needs" lists the earlier steps whose comments a step builds on: a step starts
+# once they are written (or skipped), so the workflow is a dependency graph.
+# Repetitions of a step, and its per-action comments, only need those steps and
+# are generated side by side.
 ticket_status_steps_prompts = [
     {
         "status": "Open",
         "type": "mandatory",
         "recurrence": "once",
+        "needs": [],
         "prompt": (
             "As the technician involved in the A220 aircraft manufacturing process who opened the ticket, "
             "provide a detailed and realistic description of the non-conformity. "
@@ -144,6 +225,7 @@ ticket_status_steps_prompts = [
         "status": "Technical Analysis",
         "type": "mandatory",
         "recurrence": "once",
+        "needs": ["Open"],
         "prompt": (
             "As a technical analyst in the A220 aircraft manufacturing process, analyze the issue described. "
             "Provide insights based on previous comments and the ticket description, using professional language appropriate for an engineer, using telegraphic-synthetic and minimalistic style with bullet points."
@@ -154,6 +236,7 @@ ticket_status_steps_prompts = [
         "status": "Technical Analysis - expertise",
         "type": "optional",
         "recurrence": "many",
+        "needs": ["Technical Analysis"],
         "prompt": (
             "As an expert in the A220 aircraft manufacturing domain, offer specialized input on the issue. "
             "Expand on the analysis and previous comments with advanced technical insights, maintaining a professional tone, using telegraphic-synthetic and minimalistic style with bullet points."
@@ -163,6 +246,7 @@ ticket_status_steps_prompts = [
         "status": "Technical Analysis - validation",
         "type": "mandatory",
         "recurrence": "once",
+        "needs": ["Technical Analysis - expertise"],
         "prompt": (
             "As the technical manager overseeing the A220 aircraft manufacturing, validate the analysis provided. "
             "Offer feedback or approval, addressing any concerns in a professional manner appropriate for management, using telegraphic-synthetic and minimalistic style with bullet points."
@@ -172,66 +256,77 @@ ticket_status_steps_prompts = [
         "status": "Calculation Analysis",
         "type": "mandatory",
         "recurrence": "once",
+        "needs": ["Technical Analysis - validation"],
         "prompt": "As a calculation engineer specialist, perform calculation analysis related to the issue and document your findings, using telegraphic-synthetic and minimalistic style with bullet points."
     },
     {
         "status": "Calculation Analysis - expertise",
         "type": "optional",
         "recurrence": "many",
+        "needs": ["Calculation Analysis"],
         "prompt": "As a calculation engineer expert in the domain, contribute specialized calculations or validations as needed, using telegraphic-synthetic and minimalistic style with bullet points."
     },
     {
         "status": "Calculation Analysis - validation",
         "type": "mandatory",
         "recurrence": "once",
+        "needs": ["Calculation Analysis - expertise"],
         "prompt": "As the calculation engineer manager, validate the calculation analysis and provide approval or request further action."
     },
     {
         "status": "Analysis & Calculation - workpackage validation",
         "type": "mandatory",
         "recurrence": "once",
+        "needs": ["Technical Analysis - validation", "Calculation Analysis - validation"],
         "prompt": "As the work package responsible, review all analyses and provide your signature with any additional comments."
     },
     {
         "status": "Root-cause analysis",
         "type": "mandatory",
         "recurrence": "once",
+        "needs": ["Analysis & Calculation - workpackage validation"],
         "prompt": "Conduct a root-cause analysis to determine the underlying issue and document your findings."
     },
     {
         "status": "Classification: Impact assessment (minor, major, critical)",
         "type": "mandatory",
         "recurrence": "once",
+        "needs": ["Root-cause analysis"],
         "prompt": "Assess the impact of the non-conformity and classify it as minor, major, or critical."
     },
     {
         "status": "Decision of corrective actions required",
         "type": "mandatory",
         "recurrence": "once",
+        "needs": ["Classification: Impact assessment (minor, major, critical)"],
         "prompt": "Decide on the necessary corrective actions and document the decisions made."
     },
     {
         "status": "Correction Action Plan Definition",
         "type": "mandatory",
         "recurrence": "once",
+        "needs": ["Decision of corrective actions required"],
         "prompt": "Define a corrective action plan detailing the steps required to resolve the issue."
     },
     {
         "status": "Correction Action Plan Execution - per action",
         "type": "mandatory",
         "recurrence": "many",
+        "needs": ["Correction Action Plan Definition"],
         "prompt": "Execute the corrective action plan and document progress and any challenges faced."
     },
     {
         "status": "Validation of corrective actions",
         "type": "mandatory",
         "recurrence": "many",
+        "needs": ["Correction Action Plan Execution - per action"],
         "prompt": "Validate that the corrective actions have resolved the issue and document your approval."
     },
     {
         "status": "Closure",
         "type": "mandatory",
         "recurrence": "once",
+        "needs": ["Validation of corrective actions"],
         "prompt": (
             "As the final reviewer, confirm that all steps have been completed satisfactorily and close the ticket. "
             "Provide a summary of the resolution, ensuring all documentation is complete, and maintain a professional tone, using telegraphic-synthetic and minimalistic style with bullet points."
@@ -239,14 +334,59 @@ ticket_status_steps_prompts = [
     }
 ]
 
-def generate_comment(ticket_id, status_info, category_name, description, previous_comments):
+system_prompt = (
+    "You write the records of non-conformity tickets in the A220 aircraft manufacturing process. "
+    "Each ticket goes through a workflow of statuses; at every status a different role adds a comment. "
+    "Use professional and technical language, telegraphic-synthetic and minimalistic style with bullet points, "
+    "and keep every answer realistic and consistent with the ticket so far."
+)
+
+def ticket_prompt(ticket_id, category_name, description, previous_comments):
+    # The ticket's stable prefix: shared instructions, ticket facts, then one
+    # message per comment so far (comments are only ever appended). The
+    # summary of folded comments is input, not something the model wrote: it
+    # goes with the ticket facts.
+    facts = f"Ticket ID: {ticket_id}\nCategory: {category_name}\nTicket Description: {description}"
+    if previous_comments and previous_comments[0].startswith(SUMMARY_PREFIX):
+        facts += "\n" + previous_comments[0]
+        previous_comments = previous_comments[1:]
+    prompt = ChatPrompt(system_prompt)
+    prompt.add("user", facts)
+    for comment in previous_comments:
+        prompt.add("assistant", comment)
+    return prompt
+
+def build_comment_request(ticket_id, status_info, category_name, description, previous_comments, rng=random,
+                          part=None, action=None):
     status = status_info["status"]
     prompt_injection = status_info["prompt"]
 
     # Decide on a word limit for the comment
-    word_limit = random.randint(20, 100)
+    word_limit = rng.randint(20, 100)
+
+    # Repeated comments of a status written together: (k, n)
+    sibling = ""
+    if part is not None:
+        sibling = (f"This is contribution {part[0]} of {part[1]} for this status: "
+                   f"cover a different aspect than the other contributions. ")
+
+    if prompt_layout == "prefix":
+        # Only this last message changes from one stage to the next, and it
+        # carries everything specific to the stage
+        action_line = f"Action: {action}\n" if action else ""
+        return ticket_prompt(ticket_id, category_name, description, previous_comments).request(
+            f"Status: {status}\n"
+            f"{action_line}"
+            f"Role: {prompt_injection}\n"
+            f"Please write your comment for this status, using professional and technical language appropriate for your role, telegraphic-synthetic and minimalistic style with bullet points. "
+            f"Ensure the response is realistic and aligns with the context provided. "
+            f"{sibling}"
+            f"Limit your response to approximately {word_limit} words."
+        )
 
     # Generate a comment using OpenAI API based on the description and previous comments
+    if action:
+        previous_comments = previous_comments + [f"Action: {action}"]
     full_prompt = (
         f"Role: {prompt_injection}\n"
         f"Ticket ID: {ticket_id}\n"
@@ -259,21 +399,21 @@ def generate_comment(ticket_id, status_info, category_name, description, previou
         f"{'-'*20}\n"
         f"Please write your comment, using professional and technical language appropriate for your role, telegraphic-synthetic and minimalistic style with bullet points. "
         f"Ensure the response is realistic and aligns with the context provided. "
+        f"{sibling}"
         f"Limit your response to approximately {word_limit} words."
     )
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [{
             "role": "user",
             "content": full_prompt,
         }],
-        temperature=0.7
-    )
-    return response.choices[0].message.content.strip()
+        "temperature": 0.7
+    }
 
-def generate_description(category_name, description_hint):
+def build_description_request(category_name, description_hint, rng=random):
     # Decide on a word limit for the description
-    word_limit = random.randint(20, 100)
+    word_limit = rng.randint(20, 100)
 
     # Generate a description using OpenAI API based on the category and hint
     prompt = (
@@ -282,18 +422,18 @@ def generate_description(category_name, description_hint):
         f"Include specific observations, measurements, or issues noted, using professional and technical language appropriate for a technician, telegraphic-synthetic and minimalistic style with bullet points.\n"
         f"Please limit your response to approximately {word_limit} words."
     )
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{
+    if prompt_layout == "prefix":
+        return ChatPrompt(system_prompt).request(prompt)
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [{
             "role": "user",
             "content": prompt,
         }],
-        temperature=0.7
-    )
-    return response.choices[0].message.content.strip()
+        "temperature": 0.7
+    }
 
-def determine_complexity(description, first_technical_analysis):
+def build_complexity_request(description, first_technical_analysis):
     prompt = (
         f"Based on the following non-conformity description and technical analysis, "
         f"determine the complexity level of the issue on a scale from 1 (low) to 3 (high). "
@@ -301,26 +441,28 @@ def determine_complexity(description, first_technical_analysis):
         f"Description: {description}\n"
         f"Technical Analysis: {first_technical_analysis}"
     )
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [{
             "role": "user",
             "content": prompt,
         }],
-        max_tokens=1,
-        temperature=0
-    )
-    complexity_str = response.choices[0].message.content.strip()
+        "max_tokens": 1,
+        "temperature": 0
+    }
+
+def parse_complexity(content, rng=random):
+    complexity_str = content.strip()
     try:
         complexity = int(complexity_str)
         if complexity in [1, 2, 3]:
             return complexity
         else:
-            return random.randint(1, 3)
+            return rng.randint(1, 3)
     except ValueError:
-        return random.randint(1, 3)
+        return rng.randint(1, 3)
 
-def determine_action_plan_length(ticket_history):
+def build_action_plan_length_request(ticket_history):
     prompt = (
         f"Given the ticket history below, estimate a realistic number of actions required "
         f"for the corrective action plan. Provide only the number of actions as an integer between 1 and 5.\n\n"
@@ -329,24 +471,250 @@ def determine_action_plan_length(ticket_history):
         f"{chr(10).join(ticket_history)}\n"
         f"{'-'*20}\n"
     )
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [{
             "role": "user",
             "content": prompt,
         }],
-        max_tokens=1,
-        temperature=0
-    )
-    num_actions_str = response.choices[0].message.content.strip()
+        "max_tokens": 1,
+        "temperature": 0
+    }
+
+def parse_action_plan_length(content, rng=random):
+    num_actions_str = content.strip()
     try:
         num_actions = int(num_actions_str)
         if 1 <= num_actions <= 5:
             return num_actions
         else:
-            return random.randint(1, 5)
+            return rng.randint(1, 5)
     except ValueError:
-        return random.randint(1, 5)
+        return rng.randint(1, 5)
+
+# JSON schema shared by the structured classifier and the piggybacked
+# Technical Analysis response
+classification_properties = {
+    "complexity": {"type": "integer", "enum": [1, 2, 3]},
+    "action_plan_length": {"type": "integer", "enum": [1, 2, 3, 4, 5]}
+}
+
+def build_classification_request(description, first_technical_analysis):
+    prompt = (
+        f"Based on the following non-conformity description and technical analysis, "
+        f"determine the complexity level of the issue on a scale from 1 (low) to 3 (high), "
+        f"and estimate a realistic number of actions (1 to 5) required for the corrective action plan.\n\n"
+        f"Description: {description}\n"
+        f"Technical Analysis: {first_technical_analysis}"
+    )
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [{
+            "role": "user",
+            "content": prompt,
+        }],
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "ticket_classification",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": classification_properties,
+                    "required": ["complexity", "action_plan_length"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "temperature": 0
+    }
+
+def parse_classification(content, rng=random):
+    try:
+        data = json.loads(content)
+        complexity = data["complexity"]
+        num_actions = data["action_plan_length"]
+    except (ValueError, KeyError, TypeError):
+        return rng.randint(1, 3), rng.randint(1, 5)
+    return parse_complexity(str(complexity), rng), parse_action_plan_length(str(num_actions), rng)
+
+def build_piggyback_request(comment_request):
+    # Same comment request, asking for the classification alongside the comment
+    request = dict(comment_request)
+    request["messages"] = comment_request["messages"][:-1] + [{
+        "role": "user",
+        "content": (
+            comment_request["messages"][-1]["content"] + "\n"
+            "Return a JSON object with your comment in `comment`, the complexity level of the issue "
+            "from 1 (low) to 3 (high) in `complexity`, and a realistic number of actions (1 to 5) "
+            "for the corrective action plan in `action_plan_length`."
+        ),
+    }]
+    request["response_format"] = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "technical_analysis",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": dict({"comment": {"type": "string"}}, **classification_properties),
+                "required": ["comment", "complexity", "action_plan_length"],
+                "additionalProperties": False
+            }
+        }
+    }
+    return request
+
+def parse_piggyback(content, rng=random):
+    # Returns (comment, complexity, action_plan_length); the classification is
+    # None when the response is not the expected JSON object
+    try:
+        data = json.loads(content)
+        comment = data["comment"].strip()
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return content.strip(), None, None
+    complexity = parse_complexity(str(data.get("complexity")), rng)
+    num_actions = parse_action_plan_length(str(data.get("action_plan_length")), rng)
+    return comment, complexity, num_actions
+
+def record_usage(usage):
+    usage_totals["calls"] += 1
+    prompt_tokens, completion_tokens, cached_tokens = usage_counts(usage)
+    usage_totals["prompt_tokens"] += prompt_tokens
+    usage_totals["completion_tokens"] += completion_tokens
+    usage_totals["cached_tokens"] += cached_tokens
+
+def tagged(function, params, **tags):
+    # What the workflows yield: the chat completion parameters, plus the
+    # function and ticket context they belong to (category, status, ...)
+    return {"function": function, "tags": tags, "params": params}
+
+def record_call(request, started, timing, response=None, source="api"):
+    if telemetry is not None:
+        # Priced at the model that answered, which an endpoint may have swapped
+        telemetry.record(
+            request["function"], request["tags"], getattr(response, "model", None) or request["params"].get("model"),
+            time.perf_counter() - started, timing.get("queue_wait", 0.0),
+            getattr(response, "usage", None), source
+        )
+
+def without_retries(openai_client):
+    # The scheduler retries chat completions itself; the batch submitter's
+    # file and batch calls keep the client's own retries
+    if openai_client not in retryless_clients:
+        retryless_clients[openai_client] = openai_client.with_options(max_retries=0)
+    return retryless_clients[openai_client]
+
+def create_completion(params, timing, served=None):
+    # One API call, through the endpoint pool and the rate limiter when set.
+    # served["endpoint"] is the pool endpoint that answered.
+    create_raw = (without_retries(client) if rate_limiter is not None else client).chat.completions.with_raw_response.create
+    if endpoint_pool is not None:
+        create_raw = lambda **params: endpoint_pool.create(served, **params)
+    if rate_limiter is not None:
+        return rate_limiter.call(create_raw, params, timing)
+    return create_raw(**params).parse()
+
+def batch_complete(params):
+    # Answers a local batch line from the API directly: the batch engine
+    # already looked the request up in the cache, stores the answer and
+    # records the usage of the body returned here
+    return create_completion(params, {}).model_dump(exclude_none=True)
+
+def batch_recorder(source):
+    # record callback for run_workflows_in_batches: usage comes from the
+    # response bodies of the batch output file
+    def record(request, body, seconds):
+        if body is None:
+            if telemetry is not None:
+                telemetry.record(request["function"], request["tags"], request["params"].get("model"), seconds, source="cache")
+            return
+        usage = CompletionUsage.model_validate(body["usage"]) if body.get("usage") else None
+        record_usage(usage)
+        if telemetry is not None:
+            telemetry.record(
+                request["function"], request["tags"], body.get("model") or request["params"].get("model"), seconds,
+                usage=usage, source=source
+            )
+    return record
+
+def cacheable(served):
+    # An endpoint that swaps the model did not answer the request as cached
+    endpoint = served.get("endpoint")
+    return endpoint is None or endpoint.model is None
+
+def complete_chat(request):
+    started = time.perf_counter()
+    timing = {}
+    if text_backend is not None:
+        content = text_backend.complete(request)
+        record_call(request, started, timing, source="local")
+        return content
+    params = request["params"]
+    if response_cache is not None:
+        content = response_cache.get(params)
+        if content is not None:
+            record_call(request, started, timing, source="cache")
+            return content
+    served = {}
+    response = create_completion(params, timing, served)
+    record_usage(getattr(response, "usage", None))
+    record_call(request, started, timing, response)
+    content = response.choices[0].message.content
+    if response_cache is not None and cacheable(served):
+        response_cache.put(params, content)
+    return content
+
+async def acomplete_chat(request):
+    started = time.perf_counter()
+    timing = {}
+    if text_backend is not None:
+        content = text_backend.complete(request)
+        record_call(request, started, timing, source="local")
+        return content
+    params = request["params"]
+    if response_cache is not None:
+        content = response_cache.get(params)
+        if content is not None:
+            record_call(request, started, timing, source="cache")
+            return content
+    served = {}
+    chat_client = without_retries(async_client) if rate_limiter is not None else async_client
+    create_raw = chat_client.chat.completions.with_raw_response.create
+    if endpoint_pool is not None:
+        create_raw = lambda **params: endpoint_pool.acreate(served, **params)
+    if rate_limiter is not None:
+        response = await rate_limiter.acall(create_raw, params, timing)
+    else:
+        response = (await create_raw(**params)).parse()
+    record_usage(getattr(response, "usage", None))
+    record_call(request, started, timing, response)
+    content = response.choices[0].message.content
+    if response_cache is not None and cacheable(served):
+        response_cache.put(params, content)
+    return content
+
+def generate_comment(ticket_id, status_info, category_name, description, previous_comments, rng=random):
+    request = build_comment_request(ticket_id, status_info, category_name, description, previous_comments, rng)
+    return complete_chat(tagged(
+        "generate_comment", request, category=category_name, status=status_info["status"]
+    )).strip()
+
+def generate_description(category_name, description_hint, rng=random):
+    return complete_chat(tagged(
+        "generate_description", build_description_request(category_name, description_hint, rng),
+        category=category_name, hint=description_hint
+    )).strip()
+
+def determine_complexity(description, first_technical_analysis, rng=random):
+    return parse_complexity(complete_chat(tagged(
+        "determine_complexity", build_complexity_request(description, first_technical_analysis)
+    )), rng)
+
+def determine_action_plan_length(ticket_history, rng=random):
+    return parse_action_plan_length(complete_chat(tagged(
+        "determine_action_plan_length", build_action_plan_length_request(ticket_history)
+    )), rng)
 
 def generate_ticket_dates(num_tickets, start_date, end_date):
     total_days = (end_date - start_date).days + 1
@@ -357,102 +725,722 @@ def generate_ticket_dates(num_tickets, start_date, end_date):
         dates.append(date)
     return dates
 
-def generate_tickets(category_code, category_info, ticket_dates):
-    tickets = []
+def report_context(ticket_id, context):
+    if context_budget is not None:
+        context_totals["before"] += context.tokens_before
+        context_totals["after"] += context.tokens_after
+        print(f"{ticket_id}: history tokens sent {context.tokens_before} -> {context.tokens_after}")
+
+# Stages followed by one entry per action of the corrective action plan
+per_action_statuses = ("Correction Action Plan Execution - per action", "Validation of corrective actions")
+
+# (step index, status, action number or 0) for each slot code of a planned skeleton
+skeleton_slot_kinds = slot_statuses(ticket_status_steps_prompts, per_action_statuses)
+
+def comment_request(ticket_id, slot, category_name, description, description_hint, history, rng, part=None):
+    step_index, status, action, piggyback = slot
+    params = build_comment_request(
+        ticket_id, ticket_status_steps_prompts[step_index], category_name, description, history, rng, part, action
+    )
+    if piggyback:
+        params = build_piggyback_request(params)
+    tags = {"action": action} if action else {}
+    return tagged("generate_comment", params, category=category_name, status=status, hint=description_hint, **tags)
+
+def read_comment(slot, content, rng):
+    # (comment, (complexity, num_actions) or None)
+    if slot[3]:
+        comment, complexity, num_actions = parse_piggyback(content, rng)
+        return comment, (complexity, num_actions)
+    return content.strip(), None
+
+def sibling_parts(slots):
+    # (k, n) for the k-th of n repeats of a slot, None for slots that appear once
+    totals = {}
+    for slot in slots:
+        totals[slot[:3]] = totals.get(slot[:3], 0) + 1
+    seen = {}
+    parts = []
+    for slot in slots:
+        seen[slot[:3]] = seen.get(slot[:3], 0) + 1
+        parts.append((seen[slot[:3]], totals[slot[:3]]) if totals[slot[:3]] > 1 else None)
+    return parts
+
+def comment_wave(ticket_id, slots, category_name, description, description_hint, previous_comments, rng):
+    # Sub-workflow writing sibling comments, given as slots (step index,
+    # status, action or None, piggyback). Siblings see the same history and
+    # are yielded together as a list, answered with the list of their texts;
+    # chained stages are written one after the other instead. Repeats of a
+    # status are told their position so that no two requests are identical.
+    # Returns read_comment() of each slot, in order.
+    replies = []
+    parts = sibling_parts(slots)
+    if stage_schedule == "chain":
+        for slot, part in zip(slots, parts):
+            yield from compact_context(previous_comments)
+            reply = read_comment(slot, (yield comment_request(
+                ticket_id, slot, category_name, description, description_hint, previous_comments.lines(), rng, part
+            )), rng)
+            previous_comments.append(reply[0])
+            replies.append(reply)
+        return replies
+    yield from compact_context(previous_comments)
+    requests = [
+        comment_request(ticket_id, slot, category_name, description, description_hint, previous_comments.lines(), rng, part)
+        for slot, part in zip(slots, parts)
+    ]
+    if len(requests) == 1:
+        contents = [(yield requests[0])]
+    else:
+        contents = yield requests
+    for slot, content in zip(slots, contents):
+        reply = read_comment(slot, content, rng)
+        previous_comments.append(reply[0])
+        replies.append(reply)
+    return replies
+
+def ticket_workflow(ticket_id, category_info, date_opened, rng):
+    # Generator describing one ticket: it yields chat completion requests and
+    # receives the raw completion text back, so the same workflow can be driven
+    # sequentially, concurrently or in batches. The stages are walked as a
+    # graph: every step whose needs are written starts in the same wave, and
+    # its comments are yielded together (see comment_wave).
     category_name = category_info["category"]
-    labels = category_info["label"]
-    for i, date_opened in enumerate(ticket_dates):
-        ticket_id = f"{category_code}-{i+1:04d}"
-        description_hint = random.choice(labels)
-        description = generate_description(category_name, description_hint)
-        status_history = []
-        previous_comments = []
+    description_hint = rng.choice(category_info["label"])
+    description = (yield tagged(
+        "generate_description", build_description_request(category_name, description_hint, rng),
+        category=category_name, hint=description_hint
+    )).strip()
+    previous_comments = CommentContext(context_budget, context_keep_recent)
 
-        current_date = date_opened
-        action_plan_actions = []
-        first_technical_analysis = ""
+    # (step index, status, action, comment) in the order they were written
+    entries = []
+    done = set()
+    action_plan_actions = []
+    first_technical_analysis = ""
+    # Memoized per ticket: the inputs do not change once Technical Analysis is written
+    complexity = None
+    num_actions = None
 
-        for status_info in ticket_status_steps_prompts:
+    while len(done) < len(ticket_status_steps_prompts):
+        wave = [
+            status_info for status_info in ticket_status_steps_prompts
+            if status_info["status"] not in done and all(need in done for need in status_info["needs"])
+        ]
+        if not wave:
+            raise ValueError(f"Stages with unmet needs: {[s['status'] for s in ticket_status_steps_prompts if s['status'] not in done]}")
+        started = []
+        slots = []
+        for status_info in wave:
             status = status_info["status"]
-            count = 1
+            step_index = ticket_status_steps_prompts.index(status_info)
             if status_info["type"] == "optional":
-                if random.choice([True, False]):
-                    continue  # Skip optional steps randomly
+                if rng.choice([True, False]):
+                    done.add(status)  # Skip optional steps randomly
+                    continue
+            count = 1
             if status_info["recurrence"] == "many":
-                complexity = determine_complexity(description, first_technical_analysis)
-                count = random.randint(1, complexity) if complexity > 1 else 1
-
-            for _ in range(count):
-                comment = generate_comment(ticket_id, status_info, category_name, description, previous_comments)
-                previous_comments.append(comment)
-                status_entry = {
-                    "Status": status_info["status"],
-                    "Date": current_date.strftime("%Y-%m-%d"),
-                    "Comment": comment
-                }
-                status_history.append(status_entry)
-                if status_info["status"] == "Technical Analysis" and not first_technical_analysis:
-                    first_technical_analysis = comment
-                # Adjust date progression
-                delta_days = random.randint(1, 5)
-                current_date += timedelta(days=delta_days)
-
+                if complexity is None and classifier_mode == "structured":
+                    complexity, num_actions = parse_classification((yield tagged(
+                        "determine_classification", build_classification_request(description, first_technical_analysis),
+                        category=category_name, status=status
+                    )), rng)
+                elif complexity is None:
+                    complexity = parse_complexity((yield tagged(
+                        "determine_complexity", build_complexity_request(description, first_technical_analysis),
+                        category=category_name, status=status
+                    )), rng)
+                count = rng.randint(1, complexity) if complexity > 1 else 1
+            started.append(status)
+            piggyback = classifier_mode == "piggyback" and status == "Technical Analysis" and not first_technical_analysis
+            slots.extend([(step_index, status, None, piggyback)] * count)
             # Special handling for action plan steps
-            if status_info["status"] == "Correction Action Plan Definition":
-                num_actions = determine_action_plan_length(previous_comments)
+            if status in per_action_statuses:
+                slots.extend((step_index, f"{status} - {action}", action, False) for action in action_plan_actions)
+
+        replies = []
+        if slots:
+            replies = yield from comment_wave(
+                ticket_id, slots, category_name, description, description_hint, previous_comments, rng
+            )
+        for (step_index, status, action, _), (comment, classification) in zip(slots, replies):
+            entries.append((step_index, status, action, comment))
+            if classification is not None:
+                complexity, num_actions = classification
+            if status == "Technical Analysis" and not first_technical_analysis:
+                first_technical_analysis = comment
+
+        for status in started:
+            done.add(status)
+            if status == "Correction Action Plan Definition":
+                if num_actions is None:
+                    yield from compact_context(previous_comments)
+                    num_actions = parse_action_plan_length((yield tagged(
+                        "determine_action_plan_length", build_action_plan_length_request(previous_comments.lines()),
+                        category=category_name, status=status
+                    )), rng)
                 action_plan_actions = [f"Action {j+1}" for j in range(num_actions)]
-            elif status_info["status"] == "Correction Action Plan Execution - per action":
-                for action in action_plan_actions:
-                    delta_days = random.randint(5, 15)
-                    current_date += timedelta(days=delta_days)
-                    action_comment = generate_comment(
-                        ticket_id,
-                        status_info,
-                        category_name,
-                        description,
-                        previous_comments + [f"Action: {action}"]
-                    )
-                    previous_comments.append(action_comment)
-                    status_entry = {
-                        "Status": f"{status_info['status']} - {action}",
-                        "Date": current_date.strftime("%Y-%m-%d"),
-                        "Comment": action_comment
-                    }
-                    status_history.append(status_entry)
-                continue
-            elif status_info["status"] == "Validation of corrective actions":
-                for action in action_plan_actions:
-                    delta_days = random.randint(1, 5)
-                    current_date += timedelta(days=delta_days)
-                    validation_comment = generate_comment(
-                        ticket_id,
-                        status_info,
-                        category_name,
-                        description,
-                        previous_comments + [f"Action: {action}"]
-                    )
-                    previous_comments.append(validation_comment)
-                    status_entry = {
-                        "Status": f"{status_info['status']} - {action}",
-                        "Date": current_date.strftime("%Y-%m-%d"),
-                        "Comment": validation_comment
-                    }
-                    status_history.append(status_entry)
+
+    report_context(ticket_id, previous_comments)
+
+    # The history follows the workflow order, whatever order it was written in
+    status_history = []
+    current_date = date_opened
+    for step_index, status, action, comment in sorted(entries, key=lambda entry: entry[0]):
+        # Adjust date progression
+        if action is None:
+            status_history.append({"Status": status, "Date": current_date.strftime("%Y-%m-%d"), "Comment": comment})
+            current_date += timedelta(days=rng.randint(1, 5))
+            continue
+        if ticket_status_steps_prompts[step_index]["status"] == "Correction Action Plan Execution - per action":
+            current_date += timedelta(days=rng.randint(5, 15))
+        else:
+            current_date += timedelta(days=rng.randint(1, 5))
+        status_history.append({"Status": status, "Date": current_date.strftime("%Y-%m-%d"), "Comment": comment})
+
+    return {
+        "Ticket ID": ticket_id,
+        "Category": category_name,
+        "Open Date": date_opened.strftime("%Y-%m-%d"),
+        "Initial Description": description,
+        "Status History": status_history
+    }
+
+def whole_ticket_schema():
+    statuses = []
+    for status_info in ticket_status_steps_prompts:
+        statuses.append(status_info["status"])
+        if status_info["status"] in per_action_statuses:
+            statuses.extend(f"{status_info['status']} - Action {j+1}" for j in range(5))
+    return {
+        "type": "object",
+        "properties": {
+            "description": {"type": "string"},
+            "status_history": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "status": {"type": "string", "enum": statuses},
+                        "comment": {"type": "string"}
+                    },
+                    "required": ["status", "comment"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["description", "status_history"],
+        "additionalProperties": False
+    }
+
+def build_whole_ticket_request(ticket_id, category_name, description_hint, rng=random):
+    word_limit = rng.randint(20, 100)
+    steps = []
+    for n, status_info in enumerate(ticket_status_steps_prompts):
+        if status_info["recurrence"] == "many":
+            rule = "optional, 0 to 3 entries" if status_info["type"] == "optional" else "1 to 3 entries"
+        else:
+            rule = "optional, at most once" if status_info["type"] == "optional" else "exactly once"
+        steps.append(f"{n+1}. {status_info['status']} ({rule}): {status_info['prompt']}")
+    prompt = (
+        f"You are generating a complete, realistic non-conformity ticket for the A220 aircraft manufacturing process.\n"
+        f"Ticket ID: {ticket_id}\n"
+        f"Category: {category_name}\n"
+        f"Hint: {description_hint}\n"
+        f"Write the initial description of the non-conformity event in approximately {word_limit} words, "
+        f"then the status history as an ordered list of comments following this workflow:\n"
+        f"{chr(10).join(steps)}\n"
+        f"The number of repeated entries should grow with the complexity of the issue. "
+        f"The corrective action plan defines between 1 and 5 actions. Right after the entries of "
+        f"'{per_action_statuses[0]}' and of '{per_action_statuses[1]}', add one entry per action with the status "
+        f"'<step> - Action 1', '<step> - Action 2', and so on, with the same number of actions for both steps.\n"
+        f"Each comment builds on the previous ones, uses professional and technical language appropriate for its role, "
+        f"telegraphic-synthetic and minimalistic style with bullet points, and is 20 to 100 words long."
+    )
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [{
+            "role": "user",
+            "content": prompt,
+        }],
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "non_conformity_ticket", "strict": True, "schema": whole_ticket_schema()}
+        },
+        "temperature": 0.7
+    }
+
+def validate_status_history(entries):
+    # Checks a generated status history against the stage rules; returns an
+    # error message, or None when it is a valid run of the workflow
+    statuses = [entry["status"] for entry in entries]
+    pos = 0
+    num_actions = None
+    for status_info in ticket_status_steps_prompts:
+        status = status_info["status"]
+        count = 0
+        while pos < len(statuses) and statuses[pos] == status:
+            count += 1
+            pos += 1
+        low = 0 if status_info["type"] == "optional" else 1
+        high = 3 if status_info["recurrence"] == "many" else 1
+        if not low <= count <= high:
+            return f"'{status}' appears {count} times, expected between {low} and {high}"
+        if status in per_action_statuses:
+            actions = 0
+            while pos < len(statuses) and statuses[pos] == f"{status} - Action {actions+1}":
+                actions += 1
+                pos += 1
+            if num_actions is None and not 1 <= actions <= 5:
+                return f"'{status}' has {actions} actions, expected between 1 and 5"
+            if num_actions is not None and actions != num_actions:
+                return f"'{status}' has {actions} actions, expected {num_actions} like the execution step"
+            num_actions = actions
+    if pos < len(statuses):
+        return f"unexpected '{statuses[pos]}' at position {pos+1}"
+    for entry in entries:
+        if not entry["comment"].strip():
+            return f"empty comment for '{entry['status']}'"
+    return None
+
+def parse_whole_ticket(content):
+    # Returns (description, entries, error)
+    try:
+        data = json.loads(content)
+        description = data["description"].strip()
+        entries = [{"status": e["status"], "comment": e["comment"]} for e in data["status_history"]]
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return None, None, f"invalid JSON ticket: {e}"
+    return description, entries, validate_status_history(entries)
+
+def whole_ticket_workflow(ticket_id, category_info, date_opened, rng):
+    # Asks for the complete ticket in one structured response and fills in the
+    # dates locally. An invalid answer is retried once with the validation
+    # error, then the ticket falls back to the per-stage workflow.
+    category_name = category_info["category"]
+    description_hint = rng.choice(category_info["label"])
+    request = tagged(
+        "generate_whole_ticket", build_whole_ticket_request(ticket_id, category_name, description_hint, rng),
+        category=category_name, hint=description_hint
+    )
+    content = yield request
+    description, entries, error = parse_whole_ticket(content)
+    if error is not None:
+        retry = dict(request, params=dict(request["params"]))
+        retry["params"]["messages"] = request["params"]["messages"] + [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": f"This ticket does not follow the workflow: {error}. Return a corrected ticket."}
+        ]
+        description, entries, error = parse_whole_ticket((yield retry))
+    if error is not None:
+        print(f"{ticket_id}: whole-ticket response rejected ({error}), generating stage by stage")
+        return (yield from ticket_workflow(ticket_id, category_info, date_opened, random.Random(rng.getrandbits(64))))
+
+    status_history = []
+    current_date = date_opened
+    for entry in entries:
+        status = entry["status"]
+        per_action = status.rsplit(" - Action ", 1)[0] if " - Action " in status else None
+        # Same date progression as the per-stage workflow
+        if per_action == per_action_statuses[0]:
+            current_date += timedelta(days=rng.randint(5, 15))
+        elif per_action == per_action_statuses[1]:
+            current_date += timedelta(days=rng.randint(1, 5))
+        status_history.append({
+            "Status": status,
+            "Date": current_date.strftime("%Y-%m-%d"),
+            "Comment": entry["comment"].strip()
+        })
+        if per_action is None:
+            current_date += timedelta(days=rng.randint(1, 5))
+
+    return {
+        "Ticket ID": ticket_id,
+        "Category": category_name,
+        "Open Date": date_opened.strftime("%Y-%m-%d"),
+        "Initial Description": description,
+        "Status History": status_history
+    }
+
+def skeleton_workflow(ticket_id, category_info, date_opened, hint, slot_status, slot_day, rng):
+    # Fills the comment slots of a ticket planned by scenario_planner: the
+    # structure and dates are fixed, only the text comes from the model.
+    # slot_status holds slot codes (see skeleton_slot_kinds), slot_day the
+    # day offsets from the open date.
+    category_name = category_info["category"]
+    description_hint = category_info["label"][hint]
+    description = (yield tagged(
+        "generate_description", build_description_request(category_name, description_hint, rng),
+        category=category_name, hint=description_hint
+    )).strip()
+    status_history = []
+    previous_comments = CommentContext(context_budget, context_keep_recent)
+    slots = []
+    for code in slot_status:
+        step_index, status, action = skeleton_slot_kinds[code]
+        slots.append((step_index, status, f"Action {action}" if action else None, False))
+    # Consecutive slots of a step are siblings, written in one wave
+    start = 0
+    while start < len(slots):
+        end = start + 1
+        while end < len(slots) and slots[end][0] == slots[start][0]:
+            end += 1
+        replies = yield from comment_wave(
+            ticket_id, slots[start:end], category_name, description, description_hint, previous_comments, rng
+        )
+        for (_, status, _, _), (comment, _), day in zip(slots[start:end], replies, slot_day[start:end]):
+            status_history.append({
+                "Status": status,
+                "Date": (date_opened + timedelta(days=int(day))).strftime("%Y-%m-%d"),
+                "Comment": comment
+            })
+        start = end
+    report_context(ticket_id, previous_comments)
+
+    return {
+        "Ticket ID": ticket_id,
+        "Category": category_name,
+        "Open Date": date_opened.strftime("%Y-%m-%d"),
+        "Initial Description": description,
+        "Status History": status_history
+    }
+
+# Tickets are described by small picklable specs and only turned into
+# workflows when they start, so specs can be shipped to worker processes:
+#   (kind, ticket_id, category_code, date_opened, seed, *extra)
+# where kind is "ticket", "whole-ticket" or "skeleton" (extra = hint,
+# slot_status, slot_day).
+def start_workflow(spec):
+    kind, ticket_id, category_code, date_opened, seed = spec[:5]
+    rng = random.Random(seed)
+    category_info = categories[category_code]
+    if kind == "skeleton":
+        return skeleton_workflow(ticket_id, category_info, date_opened, *spec[5:], rng)
+    if kind == "whole-ticket":
+        return whole_ticket_workflow(ticket_id, category_info, date_opened, rng)
+    return ticket_workflow(ticket_id, category_info, date_opened, rng)
+
+def ticket_seed(run_seed, ticket_id):
+    # A ticket's seed depends only on the run seed and its ID, so any shard or
+    # worker generating the ticket produces the same result
+    digest = hashlib.sha256(f"{run_seed}:{ticket_id}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], "big")
+
+def create_ticket_specs(category_code, ticket_dates, run_seed=None):
+    # Every ticket gets its own random generator, so the result does not depend
+    # on how tickets are scheduled. Without a run seed one is drawn from the
+    # global generator.
+    if run_seed is None:
+        run_seed = random.getrandbits(64)
+    kind = "whole-ticket" if generation_mode == "whole-ticket" else "ticket"
+    specs = []
+    for i, date_opened in enumerate(ticket_dates):
+        ticket_id = f"{category_code}-{i+1:04d}"
+        specs.append((kind, ticket_id, category_code, date_opened, ticket_seed(run_seed, ticket_id)))
+    return specs
+
+def create_augment_specs(existing_ids, total_tickets, run_seed):
+    # Specs of the tickets missing to reach `total_tickets` with the current
+    # category weights, as [(category_code, specs)]. New tickets take the
+    # lowest unused numbers of their category, so after the existing ones, and
+    # their dates and seeds depend only on the run seed and their ID: an
+    # interrupted augmentation resumes onto the same tickets.
+    used = {}
+    for ticket_id in existing_ids:
+        category_code, number = ticket_id.rsplit("-", 1)
+        used.setdefault(category_code, set()).add(int(number))
+    kind = "whole-ticket" if generation_mode == "whole-ticket" else "ticket"
+    total_days = (end_date - start_date).days + 1
+    counts = allocate_counts(total_tickets, [info["weight"] for info in categories.values()])
+    category_specs = []
+    for category_code, target in zip(categories, counts):
+        numbers = used.get(category_code, set())
+        missing = target - len(numbers)
+        specs = []
+        number = 0
+        while len(specs) < missing:
+            number += 1
+            if number in numbers:
                 continue
+            ticket_id = f"{category_code}-{number:04d}"
+            day = random.Random(ticket_seed(run_seed, ticket_id + "/open-date")).randrange(total_days)
+            specs.append((kind, ticket_id, category_code, start_date + timedelta(days=day), ticket_seed(run_seed, ticket_id)))
+        category_specs.append((category_code, specs))
+    return category_specs
+
+def shard_paths(shard):
+    # Output files of one shard, or of the whole run when shard is None
+    stem = 'non_conformities' if shard is None else f'non_conformities.shard-{shard[0]:02d}-of-{shard[1]:02d}'
+    return stem + '.jsonl', stem + '.csv', stem + '.checkpoint.jsonl'
+
+def ticket_sort_key(ticket_id):
+    # Final order: category order (categories no longer configured last), then ticket number
+    category_code, number = ticket_id.rsplit("-", 1)
+    codes = list(categories)
+    return codes.index(category_code) if category_code in categories else len(codes), category_code, int(number)
 
-        ticket = {
-            "Ticket ID": ticket_id,
-            "Category": category_name,
-            "Open Date": date_opened.strftime("%Y-%m-%d"),
-            "Initial Description": description,
-            "Status History": status_history
+def export_columnar_tables(jsonl_paths, ticket_ids, fmt, row_group_size):
+    tickets_path, events_path = columnar_paths(fmt)
+    export_columnar(jsonl_paths, ticket_ids, tickets_path, events_path, fmt, row_group_size)
+    print(f"Normalized tables saved to '{tickets_path}' and '{events_path}'")
+
+def export_viewer_bundle(jsonl_paths, ticket_ids, out_dir):
+    count = build_viewer_bundle(jsonl_paths, ticket_ids, out_dir)
+    print(f"Viewer bundle with {count} tickets saved to '{out_dir}'")
+
+def merge_shards(num_shards, columnar=None, row_group_size=65536, viewer_dir=None):
+    # Combines the JSONL logs of every shard into the final JSON and CSV. Every
+    # shard must have finished, as part of the same run, and each log is only
+    # read up to its manifest's last entry.
+    jsonl_paths = []
+    ticket_ids = []
+    run = None
+    for k in range(1, num_shards + 1):
+        jsonl_path, _, manifest_path = shard_paths((k, num_shards))
+        if not os.path.exists(manifest_path):
+            raise ValueError(f"Shard {k}/{num_shards} has no output ({manifest_path})")
+        entries, jsonl_offset, _ = read_checkpoint(manifest_path)
+        completion = read_completion(manifest_path)
+        if completion is None:
+            raise ValueError(f"Shard {k}/{num_shards} did not finish ({len(entries)} tickets recorded); "
+                             f"complete it with --resume before merging")
+        info = completion["complete"]
+        if info.get("shard") != [k, num_shards]:
+            raise ValueError(f"{manifest_path} was written by shard {info.get('shard')}, not {k}/{num_shards}")
+        if len(entries) != info["planned"]:
+            raise ValueError(f"Shard {k}/{num_shards} recorded {len(entries)} tickets but planned {info['planned']}")
+        shard_run = {key: info.get(key) for key in ("seed", "total_tickets")}
+        if run is None:
+            run = shard_run
+        elif shard_run != run:
+            raise ValueError(f"Shard {k}/{num_shards} belongs to another run ({shard_run}) than shard 1 ({run})")
+        jsonl_paths.append((jsonl_path, jsonl_offset))
+        ticket_ids.extend(entry["Ticket ID"] for entry in entries)
+    ticket_ids.sort(key=ticket_sort_key)
+    export_tickets_in_order(jsonl_paths, ticket_ids, 'non_conformities.json', 'non_conformities.csv')
+    if columnar:
+        export_columnar_tables(jsonl_paths, ticket_ids, columnar, row_group_size)
+    if viewer_dir:
+        export_viewer_bundle(jsonl_paths, ticket_ids, viewer_dir)
+    return len(ticket_ids)
+
+def create_skeleton_specs(plan):
+    # Returns [(category_code, specs), ...] in category order
+    offsets = plan["offsets"]
+    category_specs = []
+    first = 0
+    for code, category_code in enumerate(categories):
+        count = int((plan["category"] == code).sum())
+        specs = []
+        for i in range(count):
+            t = first + i
+            specs.append((
+                "skeleton",
+                f"{category_code}-{i+1:04d}",
+                category_code,
+                start_date + timedelta(days=int(plan["open_day"][t])),
+                int(plan["seed"][t]),
+                int(plan["hint"][t]),
+                plan["slot_status"][offsets[t]:offsets[t + 1]],
+                plan["slot_day"][offsets[t]:offsets[t + 1]]
+            ))
+        first += count
+        category_specs.append((category_code, specs))
+    return category_specs
+
+def answer(request, complete):
+    # Workflows yield one request, or a list of sibling requests answered with
+    # the list of their texts; here they are simply answered in turn
+    if isinstance(request, list):
+        return [complete(item) for item in request]
+    return complete(request)
+
+def run_workflow(workflow, complete=complete_chat):
+    try:
+        request = next(workflow)
+        while True:
+            request = workflow.send(answer(request, complete))
+    except StopIteration as stop:
+        return stop.value
+
+def run_sequential(specs, on_done):
+    for index, spec in enumerate(specs):
+        on_done(index, run_workflow(start_workflow(spec)))
+
+def worker_share(limit, workers):
+    return max(1, limit // workers) if limit else None
+
+def worker_config(cache_path=None, rate_limits=None, metrics_path=None, workers=1):
+    # Endpoint pools hold clients and threads: workers build their own, each
+    # with an equal share of every endpoint's configured rate limits
+    pool = None
+    if endpoint_pool is not None:
+        endpoints = [
+            dict(endpoint, rpm=worker_share(endpoint.get("rpm"), workers), tpm=worker_share(endpoint.get("tpm"), workers))
+            for endpoint in endpoint_pool.config
+        ]
+        pool = {
+            "endpoints": endpoints,
+            "hedge_percentile": endpoint_pool.hedge_percentile,
+            "max_hedge_ratio": endpoint_pool.max_hedge_ratio,
+            "health_interval": endpoint_pool.health_interval
         }
-        tickets.append(ticket)
+    return {
+        "generation_mode": generation_mode,
+        "classifier_mode": classifier_mode,
+        "prompt_layout": prompt_layout,
+        "stage_schedule": stage_schedule,
+        "context_budget": context_budget,
+        "context_keep_recent": context_keep_recent,
+        "text_backend": text_backend,
+        "cache_path": cache_path,
+        # Workers evict with the same limits as the parent
+        "cache_max_bytes": response_cache.max_bytes if response_cache is not None else None,
+        "cache_max_age": response_cache.max_age if response_cache is not None else None,
+        "rate_limits": rate_limits,
+        "endpoint_pool": pool,
+        "metrics_path": metrics_path
+    }
+
+def init_worker(config):
+    global generation_mode, classifier_mode, context_budget, context_keep_recent, text_backend, response_cache, rate_limiter
+    global telemetry, prompt_layout, stage_schedule, endpoint_pool
+    generation_mode = config["generation_mode"]
+    classifier_mode = config["classifier_mode"]
+    prompt_layout = config["prompt_layout"]
+    stage_schedule = config["stage_schedule"]
+    context_budget = config["context_budget"]
+    context_keep_recent = config["context_keep_recent"]
+    text_backend = config["text_backend"]
+    # Never share the parent's SQLite connection with a forked worker
+    response_cache = ResponseCache(
+        config["cache_path"], max_bytes=config["cache_max_bytes"], max_age=config["cache_max_age"]
+    ) if config["cache_path"] else None
+    rate_limiter = RateLimitScheduler(**config["rate_limits"]) if config["rate_limits"] else None
+    endpoint_pool = EndpointPool(**config["endpoint_pool"]) if config["endpoint_pool"] else None
+    # Workers append to the parent's metrics file and send their totals back with each ticket
+    telemetry = Telemetry(config["metrics_path"], truncate=False)
+
+def drain_counters():
+    # Usage, context and cache counters since the last drain, to ship them
+    # from a worker along with its telemetry
+    counters = {"usage": dict(usage_totals), "context": dict(context_totals), "cache": (0, 0)}
+    for totals in (usage_totals, context_totals):
+        for key in totals:
+            totals[key] = 0
+    if response_cache is not None:
+        counters["cache"] = (response_cache.hits, response_cache.misses)
+        response_cache.hits = response_cache.misses = 0
+    return counters
+
+def merge_counters(counters):
+    for totals, drained in ((usage_totals, counters["usage"]), (context_totals, counters["context"])):
+        for key, value in drained.items():
+            totals[key] += value
+    if response_cache is not None:
+        hits, misses = counters["cache"]
+        response_cache.hits += hits
+        response_cache.misses += misses
+
+def run_spec(item):
+    index, spec = item
+    ticket = run_workflow(start_workflow(spec))
+    return index, ticket, telemetry.drain(), drain_counters()
+
+def run_in_processes(specs, on_done, workers, cache_path=None, metrics_path=None):
+    # Whole tickets run in a pool of worker processes; results come back as
+    # they complete and are handed to on_done in the parent
+    # Each worker gets an equal share of the rate limits
+    rate_limits = None
+    if rate_limiter is not None:
+        rpm, tpm = rate_limiter.configured
+        rate_limits = {
+            "rpm": worker_share(rpm, workers),
+            "tpm": worker_share(tpm, workers),
+            "max_retries": rate_limiter.max_retries,
+            "learn_limits": rate_limiter.learn_limits
+        }
+    config = worker_config(cache_path, rate_limits, metrics_path, workers)
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(config,)) as pool:
+        for index, ticket, metrics, counters in pool.imap_unordered(run_spec, enumerate(specs), chunksize=16):
+            if telemetry is not None:
+                telemetry.merge(metrics)
+            merge_counters(counters)
+            on_done(index, ticket)
+
+def report_ticket(ticket, done, total, category_name):
+    if print_tickets:
         print(ticket)
-        if (i + 1) % 1 == 0:
-            print(f"{i + 1}/{len(ticket_dates)} tickets generated for category {category_info['category']}")
+    print(f"{done}/{total} tickets generated for category {category_name}")
+
+def generate_tickets(category_code, category_info, ticket_dates):
+    tickets = []
+    for i, spec in enumerate(create_ticket_specs(category_code, ticket_dates)):
+        ticket = run_workflow(start_workflow(spec))
+        tickets.append(ticket)
+        report_ticket(ticket, i + 1, len(ticket_dates), category_info["category"])
     return tickets
 
+async def run_async(specs, on_done, concurrency):
+    global async_client
+    try:
+        await run_workflows_async((start_workflow(spec) for spec in specs), acomplete_chat, concurrency, on_done)
+    finally:
+        if endpoint_pool is not None:
+            await endpoint_pool.aclose()
+        # The client's connections belong to this event loop: close them before
+        # asyncio.run tears it down, and leave a fresh client for the next run
+        retryless_clients.pop(async_client, None)
+        await async_client.close()
+        async_client = AsyncOpenAI(
+            api_key=async_client.api_key, base_url=async_client.base_url, max_retries=async_client.max_retries
+        )
+
+def engine_runner(args):
+    # Returns run(specs, on_done) for the engine selected on the command line
+    if args.engine == "async":
+        return lambda specs, on_done: asyncio.run(run_async(specs, on_done, args.concurrency))
+    if args.engine == "batch":
+        if args.batch_backend == "local":
+            submit = local_batch_submitter(batch_complete)
+        else:
+            submit = openai_batch_submitter(client, args.batch_poll_interval)
+        # Lines answered locally go through the live API at list price
+        record = batch_recorder("api" if args.batch_backend == "local" else "batch")
+        cache = response_cache
+        if args.batch_backend == "local" and endpoint_pool is not None and endpoint_pool.swaps_model:
+            # Answers from an endpoint that swaps the model must not be cached
+            # as the requested one's, and the batch engine cannot tell them apart
+            cache = None
+        return lambda specs, on_done: run_workflows_in_batches(
+            [start_workflow(spec) for spec in specs], submit, args.batch_dir, on_done, cache=cache, record=record
+        )
+    if args.engine == "processes":
+        return lambda specs, on_done: run_in_processes(specs, on_done, args.workers, args.cache, args.metrics)
+    return run_sequential
+
+def generate_planned_tickets(planned, run, on_ticket):
+    # planned is a list of (category_info, specs) in category order. Finished
+    # tickets are handed to on_ticket as they complete instead of being kept
+    # in memory.
+    specs = []
+    categories_of = []
+    for category_info, category_specs in planned:
+        specs.extend(category_specs)
+        categories_of.extend([category_info["category"]] * len(category_specs))
+    totals = {}
+    for category_name in categories_of:
+        totals[category_name] = totals.get(category_name, 0) + 1
+    done = {}
+
+    def on_done(index, ticket):
+        on_ticket(ticket)
+        category_name = categories_of[index]
+        done[category_name] = done.get(category_name, 0) + 1
+        report_ticket(ticket, done[category_name], totals[category_name], category_name)
+
+    run(specs, on_done)
+
 def save_tickets_to_csv(tickets, filename):
     with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
         fieldnames = ['Ticket ID', 'Category', 'Open Date', 'Initial Description', 'Status', 'Status Date', 'Comment']
@@ -470,25 +1458,272 @@ def save_tickets_to_csv(tickets, filename):
                     'Comment': status['Comment']
                 })
 
-def main():
-    start_date = datetime(2020, 1, 1)
-    end_date = datetime(2024, 10, 31)
-    total_tickets = 10  # Total number of tickets to generate
-    all_tickets = []
-    for category_code, category_info in categories.items():
-        num_tickets = int(total_tickets * category_info["weight"])
-        print(f"Generating {num_tickets} tickets for category {category_info['category']}...")
-        ticket_dates = generate_ticket_dates(num_tickets, start_date, end_date)
-        tickets = generate_tickets(
-            category_code=category_code,
-            category_info=category_info,
-            ticket_dates=ticket_dates
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got {value!r}")
+
+def parse_shard(value):
+    try:
+        k, n = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected k/N, got {value!r}")
+    if not 1 <= k <= n:
+        raise argparse.ArgumentTypeError(f"shard {value} is out of range, k must be between 1 and N")
+    return k, n
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic non-conformity tickets.")
+    parser.add_argument("--total-tickets", type=int, default=10, help="Total number of tickets to generate")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible runs")
+    parser.add_argument("--engine", choices=["sequential", "async", "batch", "processes"], default="sequential",
+                        help="Run tickets one at a time, concurrently with the async client, in Batch API waves, "
+                             "or in a pool of worker processes")
+    parser.add_argument("--concurrency", type=int, default=100,
+                        help="Maximum number of tickets in flight with the async engine")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes for the processes engine")
+    parser.add_argument("--batch-dir", default="batches", help="Directory for the batch engine's JSONL files")
+    parser.add_argument("--batch-backend", choices=["openai", "local"], default="openai",
+                        help="Submit waves to the Batch API or answer them locally with chat completions")
+    parser.add_argument("--batch-poll-interval", type=float, default=30,
+                        help="Seconds between Batch API status checks")
+    parser.add_argument("--cache", default=None, metavar="PATH",
+                        help="SQLite file used to cache and replay LLM responses")
+    parser.add_argument("--cache-max-mb", type=float, default=None,
+                        help="Evict least recently used cache entries above this size")
+    parser.add_argument("--cache-max-age-days", type=float, default=None,
+                        help="Evict cache entries older than this")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip tickets recorded in the checkpoint manifest (use the same --seed as the interrupted run)")
+    parser.add_argument("--context-budget", type=int, default=None, metavar="TOKENS",
+                        help="Token budget for the comment history in each prompt; older comments are summarized")
+    parser.add_argument("--context-keep-recent", type=int, default=2,
+                        help="Number of most recent comments always kept verbatim")
+    parser.add_argument("--classifier", choices=["separate", "structured", "piggyback"], default="separate",
+                        help="Classify complexity and action plan length with separate memoized calls, one "
+                             "structured JSON call, or extra fields on the Technical Analysis response")
+    parser.add_argument("--generation", choices=["per-stage", "whole-ticket"], default="per-stage",
+                        help="One request per workflow stage, or the whole ticket from one structured response")
+    parser.add_argument("--prompt-layout", choices=["prefix", "legacy"], default="prefix",
+                        help="Stable instructions and history first with the stage role last, so the provider can "
+                             "cache the shared prefix, or the original single-message prompt")
+    parser.add_argument("--stages", choices=["dag", "chain"], default="dag",
+                        help="Generate sibling stage comments (repeated expertise, per-action comments) together, "
+                             "concurrently with the async engine, or strictly one after the other")
+    parser.add_argument("--planner", choices=["random", "numpy"], default="random",
+                        help="Sample each ticket's structure while generating it, or plan every skeleton "
+                             "up front with the vectorized NumPy planner")
+    parser.add_argument("--skeletons", default=None, metavar="PATH",
+                        help="Use skeletons saved by scenario_planner.py instead of planning them")
+    parser.add_argument("--text-backend", choices=["openai", "template", "markov"], default="openai",
+                        help="Write the text with the OpenAI API, or locally from templates or a Markov "
+                             "model trained on a previous dataset")
+    parser.add_argument("--markov-source", default="non_conformities.json", metavar="PATH",
+                        help="Dataset (JSON or JSONL) the Markov backend is trained on")
+    parser.add_argument("--markov-order", type=int, default=2, help="Number of words of context of the Markov backend")
+    parser.add_argument("--rpm", type=int, default=None,
+                        help="Requests per minute to stay under (learned from the rate-limit headers if omitted)")
+    parser.add_argument("--tpm", type=int, default=None,
+                        help="Tokens per minute to stay under (learned from the rate-limit headers if omitted)")
+    parser.add_argument("--max-retries", type=int, default=6,
+                        help="Retries with jittered backoff for 429s, timeouts, connection and server errors")
+    parser.add_argument("--endpoints", default=None, metavar="PATH",
+                        help="JSON list of OpenAI-compatible endpoints to spread calls over (see endpoint_pool.py)")
+    parser.add_argument("--hedge-percentile", type=float, default=95,
+                        help="With --endpoints, duplicate a call on another endpoint once it is slower than this "
+                             "percentile of the endpoint's recent latencies (0 disables hedging)")
+    parser.add_argument("--max-hedge-ratio", type=float, default=0.1,
+                        help="Upper bound on the share of calls that get a hedged duplicate")
+    parser.add_argument("--health-interval", type=float, default=30.0,
+                        help="Seconds between health checks of the --endpoints")
+    parser.add_argument("--augment", action="store_true",
+                        help="Keep the existing dataset and generate only the tickets missing to reach --total-tickets "
+                             "with the current categories and weights, continuing each category's numbering")
+    parser.add_argument("--start-date", type=parse_date, default=None, metavar="YYYY-MM-DD",
+                        help=f"First possible open date (default {start_date:%Y-%m-%d})")
+    parser.add_argument("--end-date", type=parse_date, default=None, metavar="YYYY-MM-DD",
+                        help=f"Last possible open date (default {end_date:%Y-%m-%d})")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="K/N",
+                        help="Generate only the K-th of N disjoint slices of the tickets (needs --seed)")
+    parser.add_argument("--merge-shards", type=int, default=None, metavar="N",
+                        help="Merge the outputs of N shards into the final JSON and CSV, then exit")
+    parser.add_argument("--columnar", choices=["parquet", "arrow"], default=None,
+                        help="Also export normalized tickets and status events tables (needs pyarrow)")
+    parser.add_argument("--row-group-size", type=int, default=65536,
+                        help="Rows per Parquet row group / Arrow record batch of the columnar export")
+    parser.add_argument("--viewer-bundle", default=None, metavar="DIR",
+                        help="Also write the Svelte viewer's summary pages, ticket files and search index to DIR")
+    parser.add_argument("--metrics", default=None, metavar="PATH",
+                        help="Write one JSON line per LLM call (function, status, category, time, tokens, cost)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve the call metrics in Prometheus text format on http://0.0.0.0:PORT/metrics")
+    parser.add_argument("--print-tickets", action="store_true",
+                        help="Print every finished ticket, not just the progress line")
+    parser.add_argument("--fsync-every", type=int, default=1, metavar="N",
+                        help="Fsync the outputs every N tickets (they are flushed after every ticket)")
+    args = parser.parse_args(argv)
+    if args.engine == "batch" and args.text_backend != "openai":
+        parser.error("the batch engine submits requests to the API and needs --text-backend openai")
+    if (args.planner == "numpy" or args.skeletons) and args.generation == "whole-ticket":
+        parser.error("planned skeletons are filled stage by stage and cannot be used with --generation whole-ticket")
+    if args.augment and (args.shard or args.planner == "numpy" or args.skeletons):
+        parser.error("--augment numbers tickets from the existing dataset and works with --planner random, without --shard")
+    if args.shard and args.seed is None:
+        parser.error("--shard needs --seed so that every shard plans the same tickets")
+    if args.merge_shards is not None and args.merge_shards < 1:
+        parser.error("--merge-shards needs at least one shard")
+    return args
+
+def main(argv=None):
+    global response_cache, context_budget, context_keep_recent, classifier_mode, generation_mode, text_backend
+    global rate_limiter, telemetry, print_tickets, prompt_layout, start_date, end_date
+    global stage_schedule, endpoint_pool
+    args = parse_args(argv)
+    if args.merge_shards is not None:
+        try:
+            merged = merge_shards(args.merge_shards, args.columnar, args.row_group_size, args.viewer_bundle)
+        except ValueError as error:
+            raise SystemExit(f"Cannot merge shards: {error}")
+        print(f"Merged {merged} tickets from {args.merge_shards} shards into 'non_conformities.json' and 'non_conformities.csv'")
+        return
+    print_tickets = args.print_tickets
+    prompt_layout = args.prompt_layout
+    stage_schedule = args.stages
+    start_date = args.start_date or start_date
+    end_date = args.end_date or end_date
+    telemetry = Telemetry(args.metrics)
+    if args.metrics_port is not None:
+        telemetry.serve(args.metrics_port)
+    if args.text_backend == "template":
+        text_backend = TemplateBackend(ticket_status_steps_prompts, per_action_statuses)
+    elif args.text_backend == "markov":
+        text_backend = MarkovBackend(ticket_status_steps_prompts, per_action_statuses, order=args.markov_order)
+        text_backend.train(load_tickets(args.markov_source))
+    else:
+        # An endpoint pool paces each endpoint on its own rate-limit headers
+        rate_limiter = RateLimitScheduler(
+            args.rpm, args.tpm, args.concurrency, args.max_retries, learn_limits=not args.endpoints
+        )
+        if args.endpoints:
+            endpoint_pool = EndpointPool(
+                load_endpoints(args.endpoints), args.hedge_percentile, args.max_hedge_ratio, args.health_interval
+            )
+    generation_mode = args.generation
+    classifier_mode = args.classifier
+    context_budget = args.context_budget
+    context_keep_recent = args.context_keep_recent
+    if args.cache:
+        response_cache = ResponseCache(
+            args.cache,
+            max_bytes=int(args.cache_max_mb * 1024 * 1024) if args.cache_max_mb is not None else None,
+            max_age=args.cache_max_age_days * 86400 if args.cache_max_age_days is not None else None
         )
-        all_tickets.extend(tickets)
-    with open('non_conformities.json', 'w', encoding='utf-8') as f:
-        json.dump(all_tickets, f, ensure_ascii=False, indent=4)
-    save_tickets_to_csv(all_tickets, 'non_conformities.csv')
-    print("Generation complete. Data saved to 'non_conformities.json' and 'non_conformities.csv'")
+    jsonl_path, csv_path, manifest_path = shard_paths(args.shard)
+    run_seed = args.seed
+    if args.resume or args.augment:
+        # Tickets already in the log were drawn from the seed the checkpoint
+        # was started with; a resume must go on with the same one
+        run_info = read_run_info(manifest_path)
+        if run_info is None:
+            if run_seed is None and read_checkpoint(manifest_path)[0]:
+                raise SystemExit(f"'{manifest_path}' does not record its run seed: pass the run's --seed")
+        elif run_seed is None:
+            run_seed = run_info["seed"]
+            print(f"Run seed: {run_seed} (from '{manifest_path}')")
+        elif args.resume and run_seed != run_info["seed"]:
+            raise SystemExit(f"--seed {run_seed} differs from the seed {run_info['seed']} '{manifest_path}' was started with")
+    if run_seed is None:
+        run_seed = random.SystemRandom().randrange(2**32)
+        print(f"Run seed: {run_seed} (pass --seed {run_seed} to reproduce this run)")
+    random.seed(run_seed)
+    total_tickets = args.total_tickets  # Total number of tickets to generate
+    existing_json = args.augment and not os.path.exists(manifest_path) and os.path.exists('non_conformities.json')
+    writer = CheckpointedTicketWriter(
+        jsonl_path, csv_path, manifest_path, resume=args.resume or args.augment, sync_every=args.fsync_every,
+        run_info={"seed": run_seed}
+    )
+    if existing_json:
+        # A dataset without a checkpoint log (older runs): index it into the log first
+        for ticket in load_tickets('non_conformities.json'):
+            writer.write(ticket)
+        print(f"Indexed {len(writer.done)} existing tickets from 'non_conformities.json'")
+    elif writer.done:
+        print(f"{'Augmenting' if args.augment else 'Resuming'}: {len(writer.done)} tickets already generated")
+    if args.augment:
+        category_specs = create_augment_specs(writer.done, total_tickets, run_seed)
+    elif args.planner == "numpy" or args.skeletons:
+        if args.skeletons:
+            plan = load_skeletons(args.skeletons)
+        else:
+            plan = plan_skeletons(
+                total_tickets, categories, ticket_status_steps_prompts, per_action_statuses,
+                (end_date - start_date).days + 1, seed=run_seed
+            )
+        category_specs = create_skeleton_specs(plan)
+    else:
+        category_specs = []
+        counts = allocate_counts(total_tickets, [info["weight"] for info in categories.values()])
+        for category_code, num_tickets in zip(categories, counts):
+            ticket_dates = generate_ticket_dates(num_tickets, start_date, end_date)
+            # Dates are drawn for every ticket, even the ones already done or in
+            # other shards, so every run plans the same tickets
+            category_specs.append((category_code, create_ticket_specs(category_code, ticket_dates, run_seed)))
+    planned = []
+    ticket_order = []
+    index = 0
+    for category_code, specs in category_specs:
+        category_info = categories[category_code]
+        if args.shard:
+            # Round-robin over the planned order keeps every shard's mix of
+            # categories and workloads close to the whole run's
+            k, n = args.shard
+            first, index = index, index + len(specs)
+            specs = [spec for i, spec in enumerate(specs, first) if i % n == k - 1]
+        print(f"Generating {len(specs)} tickets for category {category_info['category']}...")
+        ticket_order.extend(spec[1] for spec in specs)
+        planned.append((category_info, [spec for spec in specs if spec[1] not in writer.done]))
+    if args.augment:
+        # New tickets take their place in their category's block
+        ticket_order = sorted(writer.done.union(ticket_order), key=ticket_sort_key)
+    generate_planned_tickets(planned, engine_runner(args), writer.write)
+    writer.complete({
+        "planned": len(ticket_order),
+        "seed": run_seed,
+        "total_tickets": total_tickets,
+        "shard": list(args.shard) if args.shard else None
+    })
+    writer.close()
+    if args.shard:
+        print(f"Shard {args.shard[0]}/{args.shard[1]} complete. Data saved to '{jsonl_path}'; "
+              f"combine the shards with --merge-shards {args.shard[1]}")
+    else:
+        export_tickets_in_order(jsonl_path, ticket_order, 'non_conformities.json', 'non_conformities.csv')
+        print("Generation complete. Data saved to 'non_conformities.json' and 'non_conformities.csv'")
+        if args.columnar:
+            export_columnar_tables(jsonl_path, ticket_order, args.columnar, args.row_group_size)
+        if args.viewer_bundle:
+            export_viewer_bundle(jsonl_path, ticket_order, args.viewer_bundle)
+    for line in telemetry.summary():
+        print(line)
+    telemetry.close()
+    if context_budget is not None:
+        print(f"History tokens sent: {context_totals['before']} verbatim -> {context_totals['after']} with budget")
+    if response_cache is not None:
+        stats = response_cache.stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries, {stats['bytes']} bytes")
+        response_cache.close()
+    if rate_limiter is not None and args.engine != "processes":
+        stats = rate_limiter.stats
+        print(f"API calls: {stats['calls']} succeeded, {stats['retries']} retries "
+              f"({stats['rate_limited']} rate limited), {stats['failures']} failed")
+    if endpoint_pool is not None:
+        if args.engine != "processes":
+            for line in endpoint_pool.summary():
+                print(line)
+        endpoint_pool.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+# Inserts between two evictions while the cache is open
+EVICT_EVERY = 500
+
+
+def request_key(request):
+    # Content address of a chat completion request (model, messages, temperature, ...)
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    # SQLite-backed store of completion texts keyed on the request hash, with
+    # age- and size-based eviction and hit/miss counters for the current run.
+
+    def __init__(self, path, max_bytes=None, max_age=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.inserts = 0
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # Worker processes share the file: WAL lets readers run alongside the
+        # writer and the timeout makes concurrent commits wait instead of failing
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.conn.commit()
+        self.evict()
+
+    def get(self, request):
+        key = request_key(request)
+        row = self.conn.execute("SELECT content, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (self.max_age is not None and now - row[1] > self.max_age):
+            self.misses += 1
+            return None
+        self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self.conn.commit()
+        self.hits += 1
+        return row[0]
+
+    def put(self, request, content):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, content, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (request_key(request), content, len(content.encode('utf-8')), now, now)
+        )
+        self.conn.commit()
+        self.inserts += 1
+        if self.inserts % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        if self.max_age is not None:
+            self.conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+        if self.max_bytes is not None:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # Drop the least recently used entries until the store fits
+                removed = 0
+                doomed = []
+                for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                    if total - removed <= self.max_bytes:
+                        break
+                    doomed.append((key,))
+                    removed += size
+                self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.conn.commit()
+
+    def stats(self):
+        entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size
+        }
+
+    def close(self):
+        self.evict()
+        self.conn.close()
@@ -0,0 +1,260 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI chat completions endpoint, to exercise
+# retries, rate limiting and concurrency offline. Point the client at it with
+#   OPENAI_BASE_URL=http://127.0.0.1:8011/v1 OPENAI_API_KEY=mock
+# Answers are deterministic per request; latency, injected stragglers and
+# 429/500 errors, and the enforced RPM/TPM limits are configurable. GET
+# /v1/models answers health checks. Prompt caching is simulated like
+# the provider's: prefixes of 1024 tokens and more, in 128-token steps, that
+# were seen recently are reported in usage.prompt_tokens_details.cached_tokens.
+
+# Prompt caching granularity, in characters (about 4 per token)
+CACHE_MIN_CHARS = 4096
+CACHE_STEP_CHARS = 512
+CACHE_ENTRIES = 200000
+
+WORDS = (
+    "inspection torque alignment deviation tolerance bracket harness connector batch supplier "
+    "procedure calibration fastener sealant corrosion rework drawing revision gauge measurement "
+    "analysis validation signature containment quarantine root cause action plan closure"
+).split()
+
+
+def sample_schema(schema, rng):
+    # Minimal instance of a JSON schema (objects, arrays, enums, strings, integers)
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: sample_schema(value, rng) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [sample_schema(schema["items"], rng) for _ in range(rng.randint(1, 3))]
+    if kind == "integer":
+        return rng.randint(1, 3)
+    return "- " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20)))
+
+
+def completion_text(body, rng):
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return json.dumps(sample_schema(response_format["json_schema"]["schema"], rng))
+    if body.get("max_tokens") == 1:
+        return str(rng.randint(1, 3))
+    lines = []
+    for _ in range(rng.randint(2, 5)):
+        lines.append("- " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))))
+    return "\n".join(lines)
+
+
+class MockState:
+
+    def __init__(self, latency_ms=200.0, latency_sigma=0.5, rate_limit_error_rate=0.0,
+                 server_error_rate=0.0, rpm=None, tpm=None, seed=0, responder=None, slow_rate=0.0, slow_ms=0.0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        # Share of requests delayed by slow_ms more, the long tail of a busy server
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.rate_limit_error_rate = rate_limit_error_rate
+        self.server_error_rate = server_error_rate
+        self.rpm = rpm
+        self.tpm = tpm
+        # Optional responder(body, rng) returning the content, or None for the default answer
+        self.responder = responder
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_requests = 0
+        self.window_tokens = 0
+        self.counts = {"requests": 0, "rate_limited": 0, "server_errors": 0, "slow": 0}
+        self.prefixes = OrderedDict()
+
+    def cached_tokens(self, messages):
+        # Longest previously seen prefix of the rendered conversation
+        text = "".join(f"<{message['role']}>{message.get('content') or ''}" for message in messages).encode('utf-8')
+        digest = hashlib.sha256()
+        keys = []
+        for end in range(CACHE_STEP_CHARS, len(text) + 1, CACHE_STEP_CHARS):
+            digest.update(text[end - CACHE_STEP_CHARS:end])
+            if end >= CACHE_MIN_CHARS:
+                keys.append((end, digest.copy().digest()))
+        cached = 0
+        with self.lock:
+            for end, key in keys:
+                if key not in self.prefixes:
+                    break
+                cached = end
+            for end, key in keys:
+                self.prefixes[key] = True
+                self.prefixes.move_to_end(key)
+            while len(self.prefixes) > CACHE_ENTRIES:
+                self.prefixes.popitem(last=False)
+        return cached // 4
+
+    def latency(self):
+        # Log-normal around the median latency
+        with self.lock:
+            latency = self.latency_ms / 1000 * math.exp(self.rng.gauss(0, self.latency_sigma))
+            if self.slow_rate and self.rng.random() < self.slow_rate:
+                self.counts["slow"] += 1
+                latency += self.slow_ms / 1000
+            return latency
+
+    def admit(self, tokens):
+        # Returns (status, headers) under a fixed one-minute window
+        with self.lock:
+            self.counts["requests"] += 1
+            now = time.monotonic()
+            if now - self.window_start >= 60:
+                self.window_start, self.window_requests, self.window_tokens = now, 0, 0
+            reset = 60 - (now - self.window_start)
+            headers = {}
+            if self.rpm:
+                headers["x-ratelimit-limit-requests"] = str(self.rpm)
+                headers["x-ratelimit-remaining-requests"] = str(max(0, self.rpm - self.window_requests - 1))
+                headers["x-ratelimit-reset-requests"] = f"{reset:.3f}s"
+            if self.tpm:
+                headers["x-ratelimit-limit-tokens"] = str(self.tpm)
+                headers["x-ratelimit-remaining-tokens"] = str(max(0, self.tpm - self.window_tokens - tokens))
+                headers["x-ratelimit-reset-tokens"] = f"{reset:.3f}s"
+            over = (self.rpm and self.window_requests + 1 > self.rpm) or (self.tpm and self.window_tokens + tokens > self.tpm)
+            if over or self.rng.random() < self.rate_limit_error_rate:
+                self.counts["rate_limited"] += 1
+                headers["retry-after-ms"] = str(int(reset * 1000) if over else 500)
+                return 429, headers
+            if self.rng.random() < self.server_error_rate:
+                self.counts["server_errors"] += 1
+                return 500, headers
+            self.window_requests += 1
+            self.window_tokens += tokens
+            return 200, headers
+
+
+def make_handler(state):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def handle(self):
+            try:
+                super().handle()
+            except ConnectionResetError:
+                # The client dropped a kept-alive connection, e.g. closing a cancelled hedge
+                pass
+
+        def send_json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode('utf-8')
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up, e.g. on a hedged request that lost the race
+                self.close_connection = True
+
+        def do_GET(self):
+            if not self.path.rstrip("/").endswith("/models"):
+                self.send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+                return
+            self.send_json(200, {"object": "list", "data": [
+                {"id": "gpt-4o-mini", "object": "model", "created": 0, "owned_by": "mock"}
+            ]})
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+                return
+            body = json.loads(raw)
+            prompt = "".join(message.get("content") or "" for message in body.get("messages", []))
+            prompt_tokens = len(prompt) // 4 + 1
+            time.sleep(state.latency())
+            status, headers = state.admit(prompt_tokens + (body.get("max_tokens") or 100))
+            if status == 429:
+                self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}, headers)
+                return
+            if status == 500:
+                self.send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}}, headers)
+                return
+            rng = random.Random(hashlib.sha256(raw).digest())
+            content = state.responder(body, rng) if state.responder else None
+            if content is None:
+                content = completion_text(body, rng)
+            completion_tokens = len(content) // 4 + 1
+            cached_tokens = min(prompt_tokens, state.cached_tokens(body.get("messages", [])))
+            self.send_json(200, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens}
+                }
+            }, headers)
+
+    return Handler
+
+
+def start_server(port=0, **options):
+    # Starts the mock in a background thread; returns (server, base_url)
+    state = MockState(**options)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server.")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Median response latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of the latency")
+    parser.add_argument("--rate-limit-error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--rpm", type=int, default=None, help="Requests per minute enforced with 429s")
+    parser.add_argument("--tpm", type=int, default=None, help="Tokens per minute enforced with 429s")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of requests delayed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=0.0, help="Extra latency of the delayed requests")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server, base_url = start_server(
+        args.port, latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+        rate_limit_error_rate=args.rate_limit_error_rate, server_error_rate=args.server_error_rate,
+        rpm=args.rpm, tpm=args.tpm, seed=args.seed, slow_rate=args.slow_rate, slow_ms=args.slow_ms
+    )
+    print(f"Mock OpenAI server listening on {base_url}")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"Mock OpenAI server: {server.state.counts}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import csv
+import io
+import json
+import os
+
+CSV_FIELDNAMES = ['Ticket ID', 'Category', 'Open Date', 'Initial Description', 'Status', 'Status Date', 'Comment']
+
+
+def ticket_csv_rows(ticket):
+    for status in ticket['Status History']:
+        yield {
+            'Ticket ID': ticket['Ticket ID'],
+            'Category': ticket['Category'],
+            'Open Date': ticket['Open Date'],
+            'Initial Description': ticket['Initial Description'],
+            'Status': status['Status'],
+            'Status Date': status['Date'],
+            'Comment': status['Comment']
+        }
+
+
+def csv_bytes(rows, header=False):
+    buffer = io.StringIO(newline='')
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDNAMES)
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def read_manifest(manifest_path):
+    # Complete lines of a manifest: the run record, ticket entries and, last,
+    # the completion record of a finished run. A torn last line from a crash
+    # is ignored.
+    records = []
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+
+def read_checkpoint(manifest_path):
+    # Returns (entries, jsonl_offset, csv_offset) for the ticket entries of
+    # the manifest
+    entries = [record for record in read_manifest(manifest_path) if "Ticket ID" in record]
+    if not entries:
+        return entries, 0, 0
+    return entries, entries[-1]["jsonl"], entries[-1]["csv"]
+
+
+def read_run_info(manifest_path):
+    # The run_info the manifest was started with (the run seed), or None for
+    # a missing manifest or one written before run records existed
+    records = read_manifest(manifest_path)
+    if records and "run" in records[0]:
+        return records[0]["run"]
+    return None
+
+
+def read_completion(manifest_path):
+    # The completion record written by CheckpointedTicketWriter.complete, or
+    # None when the run did not finish
+    records = read_manifest(manifest_path)
+    if records and "complete" in records[-1]:
+        return records[-1]
+    return None
+
+
+class CheckpointedTicketWriter:
+    # Appends every finished ticket to a JSONL file and a CSV file, then records
+    # its ID and the end offsets of both files in a manifest. Each step is
+    # flushed (and fsynced every `sync_every` tickets), so after a crash the
+    # manifest always describes a consistent prefix of both files and anything
+    # past it is truncated away. The manifest starts with a record of
+    # `run_info` (the run seed, so a resume can reuse it), and a finished run
+    # ends it with a completion record (see complete); resuming drops it.
+
+    def __init__(self, jsonl_path, csv_path, manifest_path, resume=False, sync_every=1, run_info=None):
+        self.sync_every = max(1, sync_every)
+        self.written = 0
+        self.done = set()
+        entries, jsonl_offset, csv_offset = [], 0, 0
+        if resume:
+            entries, jsonl_offset, csv_offset = read_checkpoint(manifest_path)
+            self.done = {entry["Ticket ID"] for entry in entries}
+        # Rewrite the manifest so it holds only complete entries
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if run_info is not None:
+                f.write(json.dumps({"run": run_info, "jsonl": 0, "csv": 0}, ensure_ascii=False) + "\n")
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, manifest_path)
+
+        self.jsonl = self._open_truncated(jsonl_path, jsonl_offset)
+        self.csv = self._open_truncated(csv_path, csv_offset)
+        if csv_offset == 0:
+            self._append(self.csv, csv_bytes([], header=True), True)
+        self.manifest = open(manifest_path, 'ab')
+
+    @staticmethod
+    def _open_truncated(path, offset):
+        f = open(path, 'a+b')
+        f.truncate(offset)
+        f.seek(offset)
+        return f
+
+    @staticmethod
+    def _append(f, data, sync):
+        f.write(data)
+        f.flush()
+        if sync:
+            os.fsync(f.fileno())
+
+    def write(self, ticket):
+        self.written += 1
+        sync = self.written % self.sync_every == 0
+        self._append(self.jsonl, (json.dumps(ticket, ensure_ascii=False) + "\n").encode('utf-8'), sync)
+        self._append(self.csv, csv_bytes(ticket_csv_rows(ticket)), sync)
+        entry = {"Ticket ID": ticket["Ticket ID"], "jsonl": self.jsonl.tell(), "csv": self.csv.tell()}
+        self._append(self.manifest, (json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8'), sync)
+        self.done.add(ticket["Ticket ID"])
+
+    def complete(self, info):
+        # Records that the run finished, with `info` describing what it planned
+        entry = {"complete": info, "jsonl": self.jsonl.tell(), "csv": self.csv.tell()}
+        self._append(self.manifest, (json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8'), True)
+
+    def close(self):
+        for f in (self.jsonl, self.csv, self.manifest):
+            f.flush()
+            os.fsync(f.fileno())
+        self.jsonl.close()
+        self.csv.close()
+        self.manifest.close()
+
+
+def iter_tickets_in_order(jsonl_paths, ticket_ids):
+    # Yields the tickets of one or more JSONL logs in `ticket_ids` order,
+    # holding only an ID -> (log, offset) index in memory. Tickets not listed
+    # in `ticket_ids` follow in log order. A log given as (path, end) is only
+    # read up to byte `end`, e.g. the last offset of its checkpoint manifest.
+    if isinstance(jsonl_paths, (str, tuple)):
+        jsonl_paths = [jsonl_paths]
+    jsonl_paths = [(log, None) if isinstance(log, str) else log for log in jsonl_paths]
+    offsets = {}
+    for log_index, (jsonl_path, end) in enumerate(jsonl_paths):
+        with open(jsonl_path, 'rb') as f:
+            while end is None or f.tell() < end:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                offsets[json.loads(line)["Ticket ID"]] = (log_index, offset)
+    order = [ticket_id for ticket_id in ticket_ids if ticket_id in offsets]
+    listed = set(order)
+    order.extend(ticket_id for ticket_id in offsets if ticket_id not in listed)
+
+    logs = [open(jsonl_path, 'rb') for jsonl_path, _ in jsonl_paths]
+    try:
+        for ticket_id in order:
+            log_index, offset = offsets[ticket_id]
+            log = logs[log_index]
+            log.seek(offset)
+            yield json.loads(log.readline())
+    finally:
+        for log in logs:
+            log.close()
+
+
+def export_tickets_in_order(jsonl_paths, ticket_ids, json_path, csv_path):
+    # Streams the JSONL log(s) into the legacy pretty-printed JSON array and a
+    # CSV in `ticket_ids` order (see iter_tickets_in_order)
+    json_tmp = json_path + '.tmp'
+    csv_tmp = csv_path + '.tmp'
+    with open(json_tmp, 'w', encoding='utf-8') as fjson, open(csv_tmp, 'wb') as fcsv:
+        fcsv.write(csv_bytes([], header=True))
+        fjson.write("[")
+        n = 0
+        for n, ticket in enumerate(iter_tickets_in_order(jsonl_paths, ticket_ids), 1):
+            # Same layout as json.dump(tickets, f, ensure_ascii=False, indent=4)
+            text = json.dumps(ticket, ensure_ascii=False, indent=4).replace("\n", "\n    ")
+            fjson.write(("\n    " if n == 1 else ",\n    ") + text)
+            fcsv.write(csv_bytes(ticket_csv_rows(ticket)))
+        fjson.write("\n]" if n else "]")
+    os.replace(json_tmp, json_path)
+    os.replace(csv_tmp, csv_path)
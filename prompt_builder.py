@@ -0,0 +1,23 @@
+class ChatPrompt:
+    # Chat history laid out for provider prefix caching: a fixed system
+    # message, then context messages that are only ever appended, and the
+    # instruction specific to one request last. Requests built from the same
+    # history share all of it as a prefix; only their final message differs.
+
+    def __init__(self, system, model="gpt-4o-mini", temperature=0.7):
+        self.model = model
+        self.temperature = temperature
+        self.messages = [{"role": "system", "content": system}]
+
+    def add(self, role, content):
+        self.messages.append({"role": role, "content": content})
+        return self
+
+    def request(self, instruction, **params):
+        # Chat completion parameters for the history plus `instruction`
+        return dict({
+            "model": self.model,
+            "messages": self.messages + [{"role": "user", "content": instruction}],
+            "temperature": self.temperature
+        }, **params)
+
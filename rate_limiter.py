@@ -0,0 +1,212 @@
+import asyncio
+import random
+import re
+import time
+
+import openai
+
+# Errors worth retrying: rate limits, timeouts, dropped connections and 5xx
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError
+)
+
+
+def parse_duration(value):
+    # Rate-limit reset headers look like "1s", "6m0s", "20ms" or "0.5"
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    seconds = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
+
+
+class TokenBucket:
+    # Per-minute budget refilled continuously. Takes are reservations: the
+    # balance may go negative and the caller waits for the returned delay.
+
+    def __init__(self, per_minute=None):
+        self.set_limit(per_minute)
+
+    def set_limit(self, per_minute):
+        self.per_minute = per_minute
+        self.tokens = float(per_minute) if per_minute else 0.0
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        if self.per_minute:
+            self.tokens = min(self.per_minute, self.tokens + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    def take(self, amount):
+        if not self.per_minute:
+            return 0.0
+        self.refill()
+        self.tokens -= min(amount, self.per_minute)
+        return max(0.0, -self.tokens * 60.0 / self.per_minute)
+
+    def give_back(self, amount):
+        if self.per_minute:
+            self.refill()
+            self.tokens = min(self.per_minute, self.tokens + amount)
+
+    def observe_remaining(self, remaining):
+        # The server's view wins when it has less left than we think
+        if self.per_minute:
+            self.refill()
+            self.tokens = min(self.tokens, float(remaining))
+
+
+def observe_rate_headers(requests, tokens, configured, headers):
+    # Updates a request and a token bucket from one server's x-ratelimit-*
+    # headers. Its limits are only adopted when none were configured.
+    limit_requests = headers.get("x-ratelimit-limit-requests")
+    limit_tokens = headers.get("x-ratelimit-limit-tokens")
+    if limit_requests and configured[0] is None and requests.per_minute != int(limit_requests):
+        requests.set_limit(int(limit_requests))
+    if limit_tokens and configured[1] is None and tokens.per_minute != int(limit_tokens):
+        tokens.set_limit(int(limit_tokens))
+    if headers.get("x-ratelimit-remaining-requests"):
+        requests.observe_remaining(int(headers["x-ratelimit-remaining-requests"]))
+    if headers.get("x-ratelimit-remaining-tokens"):
+        tokens.observe_remaining(int(headers["x-ratelimit-remaining-tokens"]))
+
+
+def settle_usage(tokens, response, estimate):
+    # Settles a token reservation against what the response actually used
+    usage = getattr(response, "usage", None)
+    if usage is not None and usage.total_tokens:
+        if usage.total_tokens > estimate:
+            tokens.take(usage.total_tokens - estimate)
+        else:
+            tokens.give_back(estimate - usage.total_tokens)
+
+
+def estimate_tokens(params):
+    chars = sum(len(message.get("content") or "") for message in params.get("messages", []))
+    return chars // 4 + (params.get("max_tokens") or 256)
+
+
+class RateLimitScheduler:
+    # Paces chat completion calls with request and token buckets, learns the
+    # real limits from the x-ratelimit-* response headers and `usage`, adapts
+    # the number of requests in flight (halved on 429, grown by one per
+    # window of successes) and retries transient errors with jittered
+    # exponential backoff. With learn_limits=False the rate-limit headers are
+    # ignored: in front of an EndpointPool each endpoint paces itself on its
+    # own headers, and only --rpm/--tpm apply to the whole pool.
+
+    def __init__(self, rpm=None, tpm=None, max_concurrency=100, max_retries=6, base_delay=1.0, max_delay=60.0,
+                 learn_limits=True):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.configured = (rpm, tpm)
+        self.learn_limits = learn_limits
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "failures": 0}
+        self._condition = None
+        self._loop = None
+
+    def reserve(self, estimate):
+        return max(self.requests.take(1), self.tokens.take(estimate))
+
+    def observe(self, headers, response, estimate):
+        if self.learn_limits:
+            observe_rate_headers(self.requests, self.tokens, self.configured, headers)
+        settle_usage(self.tokens, response, estimate)
+
+    def backoff(self, attempt, error):
+        self.stats["retries"] += 1
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        response = getattr(error, "response", None)
+        if isinstance(error, openai.RateLimitError):
+            self.stats["rate_limited"] += 1
+            self.limit = max(1.0, self.limit / 2)
+        if response is not None:
+            retry_after = parse_duration(response.headers.get("retry-after-ms"))
+            if retry_after is not None:
+                retry_after /= 1000
+            else:
+                retry_after = parse_duration(response.headers.get("retry-after"))
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def succeeded(self):
+        self.stats["calls"] += 1
+        self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+
+    def call(self, create_raw, params, timing=None):
+        # create_raw is a with_raw_response create method; returns the parsed
+        # completion. timing["queue_wait"] accumulates the seconds spent pacing
+        # and backing off.
+        timing = timing if timing is not None else {}
+        timing.setdefault("queue_wait", 0.0)
+        estimate = estimate_tokens(params)
+        for attempt in range(self.max_retries + 1):
+            delay = self.reserve(estimate)
+            timing["queue_wait"] += delay
+            time.sleep(delay)
+            try:
+                raw = create_raw(**params)
+            except RETRYABLE_ERRORS as error:
+                if attempt == self.max_retries:
+                    self.stats["failures"] += 1
+                    raise
+                delay = self.backoff(attempt, error)
+                timing["queue_wait"] += delay
+                time.sleep(delay)
+                continue
+            response = raw.parse()
+            self.observe(raw.headers, response, estimate)
+            self.succeeded()
+            return response
+
+    async def acall(self, create_raw, params, timing=None):
+        timing = timing if timing is not None else {}
+        timing.setdefault("queue_wait", 0.0)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+        estimate = estimate_tokens(params)
+        for attempt in range(self.max_retries + 1):
+            waiting = time.perf_counter()
+            async with self._condition:
+                await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+                self.in_flight += 1
+            timing["queue_wait"] += time.perf_counter() - waiting
+            try:
+                delay = self.reserve(estimate)
+                timing["queue_wait"] += delay
+                await asyncio.sleep(delay)
+                raw = await create_raw(**params)
+            except RETRYABLE_ERRORS as error:
+                if attempt == self.max_retries:
+                    self.stats["failures"] += 1
+                    raise
+                delay = self.backoff(attempt, error)
+                timing["queue_wait"] += delay
+            else:
+                response = raw.parse()
+                self.observe(raw.headers, response, estimate)
+                self.succeeded()
+                return response
+            finally:
+                async with self._condition:
+                    self.in_flight -= 1
+                    self._condition.notify_all()
+            await asyncio.sleep(delay)
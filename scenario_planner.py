@@ -0,0 +1,160 @@
+import argparse
+import time
+
+import numpy as np
+
+
+def allocate_counts(total, weights):
+    # Largest-remainder allocation: the counts follow the weights as closely as
+    # possible and always add up to `total` (int() truncation drops tickets)
+    weight_sum = sum(weights)
+    quotas = [total * w / weight_sum for w in weights]
+    counts = [int(q) for q in quotas]
+    by_remainder = sorted(range(len(weights)), key=lambda i: (counts[i] - quotas[i], i))
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def slot_statuses(steps, per_action_statuses, max_actions=5):
+    # Slot kinds in workflow order: one per step, followed by one per action
+    # for the per-action steps. A kind's index is its code in the skeleton.
+    kinds = []
+    for step_index, step in enumerate(steps):
+        kinds.append((step_index, step["status"], 0))
+        if step["status"] in per_action_statuses:
+            kinds.extend(
+                (step_index, f"{step['status']} - Action {k}", k) for k in range(1, max_actions + 1)
+            )
+    return kinds
+
+
+# Tickets planned per vectorized pass; fixed so that a seed always gives the
+# same plan, and small enough to bound the size of the temporaries
+CHUNK_SIZE = 1 << 20
+
+
+def plan_skeletons(total, categories, steps, per_action_statuses, total_days, seed=None,
+                   max_recurrence=3, max_actions=5):
+    # Samples the structure of `total` tickets in vectorized passes. Tickets
+    # are stored in category order, and their slots in a flat CSR layout:
+    # slots of ticket i are slot_status[offsets[i]:offsets[i+1]], and
+    # slot_day holds each slot's date as days after the ticket's open date.
+    rng = np.random.default_rng(seed)
+    category_infos = list(categories.values())
+    counts = allocate_counts(total, [info["weight"] for info in category_infos])
+    category = np.repeat(np.arange(len(category_infos), dtype=np.uint8), counts)
+    n = len(category)
+
+    open_day = rng.integers(0, total_days, n, dtype=np.int32)
+    label_counts = np.array([len(info["label"]) for info in category_infos])
+    hint = (rng.random(n) * label_counts[category]).astype(np.uint8)
+    complexity = rng.integers(1, max_recurrence + 1, n, dtype=np.uint8)
+    num_actions = rng.integers(1, max_actions + 1, n, dtype=np.uint8)
+    seeds = rng.integers(0, 2**63, n, dtype=np.uint64)
+
+    kinds = slot_statuses(steps, per_action_statuses, max_actions)
+    lengths = np.zeros(n, dtype=np.int64)
+    included = np.zeros((n, len(steps)), dtype=bool)
+    statuses = []
+    days = []
+    for first in range(0, n, CHUNK_SIZE):
+        chunk = slice(first, min(n, first + CHUNK_SIZE))
+        chunk_status, chunk_day, chunk_lengths, chunk_included = plan_slots(
+            rng, kinds, steps, per_action_statuses, complexity[chunk], num_actions[chunk]
+        )
+        statuses.append(chunk_status)
+        days.append(chunk_day)
+        lengths[chunk] = chunk_lengths
+        included[chunk] = chunk_included
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    return {
+        "category": category,
+        "open_day": open_day,
+        "hint": hint,
+        "complexity": complexity,
+        "num_actions": num_actions,
+        "included_steps": included,
+        "seed": seeds,
+        "offsets": offsets,
+        "slot_status": np.concatenate(statuses) if statuses else np.zeros(0, dtype=np.uint8),
+        "slot_day": np.concatenate(days) if days else np.zeros(0, dtype=np.int16)
+    }
+
+
+def plan_slots(rng, kinds, steps, per_action_statuses, complexity, num_actions):
+    n = len(complexity)
+    slot_counts = np.zeros((n, len(kinds)), dtype=np.uint8)
+    included = np.zeros((n, len(steps)), dtype=bool)
+    for code, (step_index, _, action) in enumerate(kinds):
+        step = steps[step_index]
+        if action:
+            slot_counts[:, code] = num_actions >= action
+            continue
+        if step["recurrence"] == "many":
+            count = (rng.random(n, dtype=np.float32) * complexity).astype(np.uint8) + 1
+        else:
+            count = np.ones(n, dtype=np.uint8)
+        if step["type"] == "optional":
+            keep = rng.random(n, dtype=np.float32) < 0.5
+            count = count * keep
+        else:
+            keep = True
+        included[:, step_index] = keep
+        slot_counts[:, code] = count
+
+    lengths = slot_counts.sum(axis=1, dtype=np.int64)
+    codes = np.arange(len(kinds), dtype=np.uint8)
+    slot_status = np.repeat(np.tile(codes, n), slot_counts.ravel())
+
+    # Date progression of the per-stage workflow: plain entries move the date
+    # 1-5 days after them, executions 5-15 days before, validations 1-5 before
+    kind_low = np.ones(len(kinds), dtype=np.int16)
+    kind_span = np.full(len(kinds), 5, dtype=np.int16)
+    kind_after = np.zeros(len(kinds), dtype=np.int16)
+    for code, (step_index, _, action) in enumerate(kinds):
+        if not action:
+            kind_after[code] = 1
+        elif steps[step_index]["status"] == per_action_statuses[0]:
+            kind_low[code], kind_span[code] = 5, 11
+    # One uniform draw per slot, within the range of the slot's kind
+    delta = (rng.random(len(slot_status), dtype=np.float32) * kind_span[slot_status]).astype(np.int16)
+    delta += kind_low[slot_status]
+    elapsed = np.cumsum(delta, dtype=np.int32)
+    start = np.concatenate((np.zeros(1, dtype=np.int32), elapsed))[np.cumsum(lengths) - lengths]
+    slot_day = elapsed - delta * kind_after[slot_status] - np.repeat(start, lengths)
+    return slot_status, slot_day.astype(np.int16), lengths, included
+
+
+def save_skeletons(plan, path):
+    np.savez(path, **plan)
+
+
+def load_skeletons(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def main():
+    import generate_tickets as gt
+
+    parser = argparse.ArgumentParser(description="Plan ticket skeletons offline.")
+    parser.add_argument("--tickets", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default="skeletons.npz")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    plan = plan_skeletons(
+        args.tickets, gt.categories, gt.ticket_status_steps_prompts, gt.per_action_statuses,
+        (gt.end_date - gt.start_date).days + 1, seed=args.seed
+    )
+    elapsed = time.perf_counter() - started
+    save_skeletons(plan, args.out)
+    print(f"Planned {len(plan['category'])} tickets and {len(plan['slot_status'])} comment slots "
+          f"in {elapsed:.2f}s, saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# USD per million tokens (input, cached input, output)
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00)
+}
+
+# Share of the list price billed for Batch API requests
+BATCH_PRICE_RATIO = 0.5
+
+# Upper bounds (seconds) of the call latency histogram
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+FIELDS = ("calls", "seconds", "queue_seconds", "prompt_tokens", "completion_tokens", "cached_tokens", "cost")
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    # Dated snapshots ("gpt-4o-mini-2024-07-18") cost what their model does;
+    # unknown models are not priced
+    model = re.sub(r"-\d{4}-\d{2}-\d{2}$", "", model or "")
+    if model not in PRICES:
+        return 0.0
+    input_price, cached_price, output_price = PRICES[model]
+    return ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1e6
+
+
+def percentile(values, p):
+    # Nearest-rank percentile, None for no values
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(len(ordered) * p / 100 + 0.5) - 1))]
+
+
+def usage_counts(usage):
+    # (prompt, completion, cached) tokens of a response's `usage`, or zeros
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0, cached or 0
+
+
+class Telemetry:
+    # Records every LLM call, tagged by function, stage status and category:
+    # wall time, time spent waiting in the rate limiter, tokens and estimated
+    # cost. Calls are appended to a JSON-lines file and aggregated in memory
+    # for the end-of-run summary and the Prometheus endpoint.
+
+    def __init__(self, metrics_path=None, truncate=True):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.buckets = {}
+        self.pending = {}
+        self.pending_buckets = {}
+        self.metrics = open(metrics_path, 'w' if truncate else 'a', encoding='utf-8', buffering=1) if metrics_path else None
+        self.server = None
+
+    def record(self, function, tags, model, seconds, queue_seconds=0.0, usage=None, source="api"):
+        prompt_tokens, completion_tokens, cached_tokens = usage_counts(usage)
+        cost = 0.0
+        if source in ("api", "batch"):
+            cost = estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+            if source == "batch":
+                cost *= BATCH_PRICE_RATIO
+        # Per-action comments count towards their stage
+        status = tags.get("status", "").split(" - Action ")[0]
+        key = (function or "unknown", status, tags.get("category", ""))
+        values = (1, seconds, queue_seconds, prompt_tokens, completion_tokens, cached_tokens, cost)
+        with self.lock:
+            self._add(self.totals, key, values)
+            self._add(self.pending, key, values)
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+            for buckets in (self.buckets, self.pending_buckets):
+                buckets.setdefault(key[0], [0] * (len(LATENCY_BUCKETS) + 1))[bucket] += 1
+            if self.metrics is not None:
+                self.metrics.write(json.dumps({
+                    "time": time.time(),
+                    "function": key[0],
+                    "status": key[1],
+                    "category": key[2],
+                    "source": source,
+                    "model": model,
+                    "seconds": round(seconds, 6),
+                    "queue_seconds": round(queue_seconds, 6),
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "cached_tokens": cached_tokens,
+                    "cost": cost
+                }, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def _add(table, key, values):
+        row = table.setdefault(key, [0] * len(FIELDS))
+        for i, value in enumerate(values):
+            row[i] += value
+
+    def drain(self):
+        # Aggregates recorded since the last drain, to ship them from a worker
+        # process to the parent
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            buckets, self.pending_buckets = self.pending_buckets, {}
+        return pending, buckets
+
+    def merge(self, drained):
+        pending, buckets = drained
+        with self.lock:
+            for key, values in pending.items():
+                self._add(self.totals, key, values)
+            for function, counts in buckets.items():
+                merged = self.buckets.setdefault(function, [0] * (len(LATENCY_BUCKETS) + 1))
+                for i, count in enumerate(counts):
+                    merged[i] += count
+
+    def grouped(self, by):
+        # Totals grouped on a subset of ("function", "status", "category")
+        index = [("function", "status", "category").index(name) for name in by]
+        groups = {}
+        with self.lock:
+            for key, values in self.totals.items():
+                self._add(groups, tuple(key[i] for i in index), values)
+        return groups
+
+    def summary(self, top=10):
+        # Lines of the end-of-run report: the stages that dominate time and spend
+        groups = self.grouped(("function", "status"))
+        if not groups:
+            return []
+        total = [sum(values[i] for values in groups.values()) for i in range(len(FIELDS))]
+        lines = [
+            f"LLM calls: {total[0]}, {total[1]:.1f}s in calls ({total[2]:.1f}s queued), "
+            f"{total[3]} prompt tokens ({total[5]} cached, {total[5] / total[3] if total[3] else 0:.0%}), "
+            f"{total[4]} completion tokens, ${total[6]:.4f}"
+        ]
+        ranked = sorted(groups.items(), key=lambda item: (item[1][1], item[1][6]), reverse=True)
+        for (function, status), values in ranked[:top]:
+            stage = f"{function} [{status}]" if status else function
+            lines.append(
+                f"  {stage}: {values[0]} calls, {values[1]:.1f}s ({values[1] / total[1] if total[1] else 0:.0%} of time) "
+                f"avg {values[1] / values[0]:.2f}s, {values[3] + values[4]} tokens, "
+                f"${values[6]:.4f} ({values[6] / total[6] if total[6] else 0:.0%} of spend)"
+            )
+        return lines
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            totals = {key: list(values) for key, values in self.totals.items()}
+            buckets = {function: list(counts) for function, counts in self.buckets.items()}
+        metrics = (
+            ("nc_llm_calls_total", "LLM calls", 0),
+            ("nc_llm_call_seconds_total", "Wall time spent in LLM calls", 1),
+            ("nc_llm_queue_seconds_total", "Time LLM calls waited in the rate limiter", 2),
+            ("nc_llm_prompt_tokens_total", "Prompt tokens", 3),
+            ("nc_llm_completion_tokens_total", "Completion tokens", 4),
+            ("nc_llm_cached_tokens_total", "Cached prompt tokens", 5),
+            ("nc_llm_cost_usd_total", "Estimated cost in USD", 6)
+        )
+        for name, help_text, i in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (function, status, category), values in sorted(totals.items()):
+                labels = f'function="{escape_label(function)}",status="{escape_label(status)}",category="{escape_label(category)}"'
+                lines.append(f"{name}{{{labels}}} {values[i]}")
+        lines.append("# HELP nc_llm_call_seconds LLM call latency")
+        lines.append("# TYPE nc_llm_call_seconds histogram")
+        for function, counts in sorted(buckets.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'nc_llm_call_seconds_bucket{{function="{function}",le="{bound}"}} {cumulative}')
+            seconds = sum(values[1] for key, values in totals.items() if key[0] == function)
+            lines.append(f'nc_llm_call_seconds_sum{{function="{function}"}} {seconds}')
+            lines.append(f'nc_llm_call_seconds_count{{function="{function}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port):
+        # Prometheus text exposition on http://0.0.0.0:port/metrics
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                data = telemetry.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        if self.metrics is not None:
+            self.metrics.close()
+            self.metrics = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from columnar_export import pa, export_columnar
+
+if pa is not None:
+    import pyarrow.parquet as pq
+
+
+def make_ticket(i):
+    # New categories and statuses keep appearing, so later row groups extend
+    # the dictionaries of earlier ones
+    history = [
+        {"Status": f"Status {k}", "Date": f"2024-02-{k + 1:02d}", "Comment": f"- comment {i}.{k}"}
+        for k in range(i % 4 + 1)
+    ]
+    return {
+        "Ticket ID": f"T-{i:04d}",
+        "Category": f"Category {i // 3}",
+        "Open Date": "2024-02-01",
+        "Initial Description": f"- description {i}",
+        "Status History": history
+    }
+
+
+@unittest.skipIf(pa is None, "pyarrow is not installed")
+class ColumnarExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.tickets = [make_ticket(i) for i in range(10)]
+        self.jsonl = self.path("tickets.jsonl")
+        with open(self.jsonl, 'w', encoding='utf-8') as f:
+            # The log is in completion order, the export in ticket ID order
+            for ticket in reversed(self.tickets):
+                f.write(json.dumps(ticket) + "\n")
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def export(self, fmt):
+        paths = self.path(f"tickets.{fmt}"), self.path(f"events.{fmt}")
+        ticket_ids = [ticket["Ticket ID"] for ticket in self.tickets]
+        count = export_columnar(self.jsonl, ticket_ids, *paths, fmt=fmt, row_group_size=3)
+        self.assertEqual(count, len(self.tickets))
+        if fmt == "parquet":
+            return [pq.read_table(path).to_pylist() for path in paths]
+        tables = []
+        for path in paths:
+            with pa.OSFile(path, 'rb') as f:
+                tables.append(pa.ipc.open_file(f).read_all().to_pylist())
+        return tables
+
+    def expected(self):
+        tickets = []
+        events = []
+        for ticket in self.tickets:
+            history = ticket["Status History"]
+            tickets.append({
+                "ticket_id": ticket["Ticket ID"], "category": ticket["Category"],
+                "open_date": date(2024, 2, 1), "initial_description": ticket["Initial Description"],
+                "num_events": len(history)
+            })
+            events.extend({
+                "ticket_id": ticket["Ticket ID"], "seq": seq, "status": status["Status"],
+                "status_date": date.fromisoformat(status["Date"]), "comment": status["Comment"]
+            } for seq, status in enumerate(history))
+        return [tickets, events]
+
+    def test_parquet_round_trip(self):
+        self.assertEqual(self.export("parquet"), self.expected())
+        self.assertEqual(pq.ParquetFile(self.path("tickets.parquet")).num_row_groups, 4)
+
+    def test_arrow_round_trip(self):
+        self.assertEqual(self.export("arrow"), self.expected())
+
+    def test_no_partial_files_are_left(self):
+        self.export("parquet")
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["events.parquet", "tickets.jsonl", "tickets.parquet"])
+
+
+if __name__ == "__main__":
+    unittest.main()
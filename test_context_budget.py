@@ -0,0 +1,58 @@
+import unittest
+
+from context_budget import CommentContext, compact_context, SUMMARY_PREFIX
+
+
+def comment(k):
+    return f"- Comment {k}: " + "finding " * 20
+
+
+def fold(context, summaries):
+    # Runs compact_context, answering each summary request with the next summary
+    requests = []
+    workflow = compact_context(context)
+    try:
+        request = next(workflow)
+        while True:
+            requests.append(request)
+            request = workflow.send(summaries[len(requests) - 1])
+    except StopIteration:
+        pass
+    return requests
+
+
+class CommentContextTest(unittest.TestCase):
+
+    def test_without_budget_every_comment_is_verbatim(self):
+        context = CommentContext()
+        for k in range(10):
+            context.append(comment(k))
+        self.assertFalse(context.needs_fold())
+        self.assertEqual(fold(context, []), [])
+        self.assertEqual(context.lines(), [comment(k) for k in range(10)])
+
+    def test_folds_older_comments_into_the_summary(self):
+        context = CommentContext(budget=60, keep_recent=2)
+        for k in range(4):
+            context.append(comment(k))
+        requests = fold(context, ["- summary of the first comments\n"])
+        self.assertEqual(len(requests), 1)
+        prompt = requests[0]["params"]["messages"][0]["content"]
+        self.assertIn(comment(0), prompt)
+        self.assertNotIn(comment(3), prompt)
+        lines = context.lines()
+        self.assertEqual(lines[0], SUMMARY_PREFIX + "- summary of the first comments")
+        self.assertEqual(lines[-2:], [comment(2), comment(3)])
+
+    def test_keeps_the_sent_history_within_budget(self):
+        context = CommentContext(budget=60, keep_recent=1)
+        for k in range(12):
+            context.append(comment(k))
+            fold(context, [f"- summary up to comment {k}"] * 12)
+            self.assertLessEqual(context.summary_tokens + sum(context.recent_tokens), 60)
+            self.assertEqual(context.lines()[-1], comment(k))
+        self.assertLess(context.tokens_after, context.tokens_before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+
+from endpoint_pool import EndpointPool, FAILURES_BEFORE_DOWN, MIN_SAMPLES
+from mock_openai_server import start_server
+
+# Nothing listens on the discard port: calls fail with a connection error
+DEAD_URL = "http://127.0.0.1:9/v1"
+
+
+def params(k):
+    return {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": f"Comment {k}"}], "max_tokens": 20}
+
+
+class EndpointPoolTest(unittest.TestCase):
+
+    def start(self, **options):
+        server, base_url = start_server(latency_ms=2, latency_sigma=0.0, **options)
+        self.addCleanup(server.shutdown)
+        return server, base_url
+
+    def pool(self, endpoints, **options):
+        pool = EndpointPool(endpoints, health_interval=0, **options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_fails_over_from_a_dead_endpoint(self):
+        _, base_url = self.start()
+        pool = self.pool([
+            {"name": "dead", "base_url": DEAD_URL, "api_key": "mock", "timeout": 2.0},
+            {"name": "live", "base_url": base_url, "api_key": "mock"}
+        ], hedge_percentile=0)
+        dead, live = pool.endpoints
+        for k in range(8):
+            served = {}
+            self.assertTrue(pool.create(served=served, **params(k)).parse().choices[0].message.content)
+            self.assertIs(served["endpoint"], live)
+        # Calls stop going to the dead endpoint once it is out of rotation
+        self.assertFalse(dead.healthy)
+        self.assertEqual(dead.stats["failures"], FAILURES_BEFORE_DOWN)
+        self.assertEqual(live.stats["calls"], 8)
+
+    def test_health_check_restores_an_endpoint(self):
+        _, base_url = self.start()
+        pool = self.pool([{"name": "live", "base_url": base_url, "api_key": "mock"}])
+        pool.endpoints[0].healthy = False
+        pool.check_health()
+        self.assertTrue(pool.endpoints[0].healthy)
+
+    def test_hedges_stay_within_max_hedge_ratio(self):
+        pool = self.pool([{"name": "a", "api_key": "mock"}, {"name": "b", "api_key": "mock"}], max_hedge_ratio=0.1)
+        for _ in range(30):
+            pool.start_call()
+        self.assertEqual(sum(pool.take_hedge(pool.endpoints[0]) for _ in range(10)), 3)
+
+    def test_hedges_slow_calls_on_another_endpoint(self):
+        servers = [self.start(slow_rate=0.2, slow_ms=200, seed=seed) for seed in (1, 2)]
+        pool = self.pool(
+            [{"name": f"mock-{k}", "base_url": base_url, "api_key": "mock"} for k, (_, base_url) in enumerate(servers)],
+            hedge_percentile=50, max_hedge_ratio=1.0
+        )
+        for k in range(MIN_SAMPLES + 30):
+            pool.create(**params(k))
+        self.assertGreater(pool.hedges, 0)
+        self.assertGreater(sum(endpoint.stats["hedge_wins"] for endpoint in pool.endpoints), 0)
+
+    def test_async_hedges_cancel_the_slower_call(self):
+        servers = [self.start(slow_rate=0.2, slow_ms=200, seed=seed) for seed in (1, 2)]
+        pool = self.pool(
+            [{"name": f"mock-{k}", "base_url": base_url, "api_key": "mock"} for k, (_, base_url) in enumerate(servers)],
+            hedge_percentile=50, max_hedge_ratio=1.0
+        )
+
+        async def run():
+            try:
+                for k in range(MIN_SAMPLES + 30):
+                    await pool.acreate(**params(k))
+            finally:
+                await pool.aclose()
+
+        asyncio.run(run())
+        self.assertGreater(pool.hedges, 0)
+        self.assertGreater(sum(endpoint.stats["hedge_wins"] for endpoint in pool.endpoints), 0)
+        # Cancelled duplicates released their slots
+        self.assertEqual([endpoint.in_flight for endpoint in pool.endpoints], [0, 0])
+
+    def test_async_fails_over_from_a_dead_endpoint(self):
+        _, base_url = self.start()
+        pool = self.pool([
+            {"name": "dead", "base_url": DEAD_URL, "api_key": "mock", "timeout": 2.0},
+            {"name": "live", "base_url": base_url, "api_key": "mock"}
+        ], hedge_percentile=0)
+
+        async def run():
+            try:
+                return await asyncio.gather(*(pool.acreate(**params(k)) for k in range(8)))
+            finally:
+                await pool.aclose()
+
+        self.assertEqual(len(asyncio.run(run())), 8)
+        self.assertEqual(pool.endpoints[1].stats["calls"], 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,298 @@
+import contextlib
+import json
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from openai import OpenAI, AsyncOpenAI
+
+import generate_tickets as gt
+from mock_openai_server import start_server
+
+
+class Crash(Exception):
+    pass
+
+
+def run_main(workdir, *argv):
+    # Runs the command line in `workdir` with the module state main() leaves behind reset
+    gt.text_backend = None
+    gt.response_cache = None
+    gt.rate_limiter = None
+    gt.endpoint_pool = None
+    cwd = os.getcwd()
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            gt.main(list(argv))
+    finally:
+        os.chdir(cwd)
+
+
+def read_outputs(workdir):
+    outputs = []
+    for name in ('non_conformities.json', 'non_conformities.csv'):
+        with open(os.path.join(workdir, name), 'rb') as f:
+            outputs.append(f.read())
+    return outputs
+
+
+def history_entries(ticket):
+    return [{"status": status["Status"], "comment": status["Comment"]} for status in ticket["Status History"]]
+
+
+class GenerationTest(unittest.TestCase):
+    # End-to-end runs of main() with the template text backend, which needs no
+    # API, comparing the files the engines and run modes write
+
+    ARGV = ("--total-tickets", "24", "--seed", "11", "--text-backend", "template")
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def run_crashing(self, workdir, *argv):
+        # Runs main() until the template backend has answered 150 requests
+        complete = gt.TemplateBackend.complete
+        calls = []
+
+        def crashing_complete(backend, request):
+            calls.append(request)
+            if len(calls) > 150:
+                raise Crash()
+            return complete(backend, request)
+
+        gt.TemplateBackend.complete = crashing_complete
+        try:
+            with self.assertRaises(Crash):
+                run_main(workdir, *argv)
+        finally:
+            gt.TemplateBackend.complete = complete
+
+    def test_async_engine_writes_the_same_tickets(self):
+        run_main(self.path("sequential"), *self.ARGV)
+        run_main(self.path("async"), *self.ARGV, "--engine", "async", "--concurrency", "4")
+        self.assertEqual(read_outputs(self.path("async")), read_outputs(self.path("sequential")))
+
+    def test_processes_engine_writes_the_same_tickets(self):
+        run_main(self.path("sequential"), *self.ARGV)
+        run_main(self.path("processes"), *self.ARGV, "--engine", "processes", "--workers", "2")
+        self.assertEqual(read_outputs(self.path("processes")), read_outputs(self.path("sequential")))
+
+    def test_processes_share_the_response_cache(self):
+        # Forked workers inherit the client pointed at the mock server
+        server, base_url = start_server(latency_ms=1, latency_sigma=0.0)
+        self.addCleanup(server.shutdown)
+        client = gt.client
+        self.addCleanup(setattr, gt, "client", client)
+        gt.client = OpenAI(base_url=base_url, api_key="mock")
+        argv = ("--total-tickets", "8", "--seed", "11", "--engine", "processes", "--workers", "4",
+                "--cache", self.path("cache.sqlite"), "--cache-max-mb", "10")
+        run_main(self.path("first"), *argv)
+        requests = server.state.counts["requests"]
+        run_main(self.path("replay"), *argv)
+        self.assertEqual(server.state.counts["requests"], requests)
+        self.assertEqual(read_outputs(self.path("replay")), read_outputs(self.path("first")))
+
+    def test_batch_engine_writes_the_same_tickets(self):
+        # The batch engine only talks to the API: both runs are answered by
+        # the mock server, whose answers depend only on the request
+        server, base_url = start_server(latency_ms=1, latency_sigma=0.0)
+        self.addCleanup(server.shutdown)
+        client = gt.client
+        self.addCleanup(setattr, gt, "client", client)
+        argv = ("--total-tickets", "6", "--seed", "11")
+        gt.client = OpenAI(base_url=base_url, api_key="mock")
+        run_main(self.path("sequential"), *argv)
+        gt.client = OpenAI(base_url=base_url, api_key="mock")
+        run_main(self.path("batch"), *argv, "--engine", "batch", "--batch-backend", "local")
+        self.assertEqual(read_outputs(self.path("batch")), read_outputs(self.path("sequential")))
+
+    def test_rate_limited_run_writes_the_same_tickets(self):
+        # The scheduler retries the mock server's injected 429s and 500s
+        argv = ("--total-tickets", "4", "--seed", "11", "--engine", "async", "--concurrency", "8")
+        client, async_client = gt.client, gt.async_client
+        self.addCleanup(setattr, gt, "client", client)
+        self.addCleanup(setattr, gt, "async_client", async_client)
+        outputs = []
+        for name, errors in (("clean", 0.0), ("flaky", 0.05)):
+            server, base_url = start_server(
+                latency_ms=1, latency_sigma=0.0, rate_limit_error_rate=errors, server_error_rate=errors, seed=2
+            )
+            self.addCleanup(server.shutdown)
+            gt.async_client = AsyncOpenAI(base_url=base_url, api_key="mock")
+            run_main(self.path(name), *argv)
+            outputs.append(read_outputs(self.path(name)))
+        self.assertGreater(server.state.counts["rate_limited"] + server.state.counts["server_errors"], 0)
+        self.assertEqual(outputs[1], outputs[0])
+
+    def test_endpoint_pool_writes_the_same_tickets(self):
+        # Two mock servers give the same answer to the same request, whichever
+        # of them gets it; the first one is also the single endpoint's
+        servers = [start_server(latency_ms=1, latency_sigma=0.0, slow_rate=0.1, slow_ms=100) for _ in range(2)]
+        for server, _ in servers:
+            self.addCleanup(server.shutdown)
+        client, async_client = gt.client, gt.async_client
+        self.addCleanup(setattr, gt, "client", client)
+        self.addCleanup(setattr, gt, "async_client", async_client)
+        gt.async_client = AsyncOpenAI(base_url=servers[0][1], api_key="mock")
+        argv = ("--total-tickets", "4", "--seed", "11", "--engine", "async", "--concurrency", "8")
+        run_main(self.path("single"), *argv)
+        endpoints = self.path("endpoints.json")
+        with open(endpoints, 'w', encoding='utf-8') as f:
+            json.dump([{"name": f"mock-{k}", "base_url": base_url, "api_key": "mock"}
+                       for k, (_, base_url) in enumerate(servers)], f)
+        run_main(self.path("pooled"), *argv, "--endpoints", endpoints, "--hedge-percentile", "50",
+                 "--max-hedge-ratio", "0.2", "--health-interval", "0")
+        self.assertEqual(read_outputs(self.path("pooled")), read_outputs(self.path("single")))
+        self.assertTrue(all(server.state.counts["requests"] for server, _ in servers))
+
+    def test_cached_run_replays_without_requests(self):
+        server, base_url = start_server(latency_ms=1, latency_sigma=0.0)
+        self.addCleanup(server.shutdown)
+        client = gt.client
+        self.addCleanup(setattr, gt, "client", client)
+        gt.client = OpenAI(base_url=base_url, api_key="mock")
+        argv = ("--total-tickets", "4", "--seed", "11", "--cache", self.path("cache.sqlite"))
+        run_main(self.path("first"), *argv)
+        requests = server.state.counts["requests"]
+        self.assertGreater(requests, 0)
+        run_main(self.path("replay"), *argv)
+        self.assertEqual(server.state.counts["requests"], requests)
+        self.assertEqual(read_outputs(self.path("replay")), read_outputs(self.path("first")))
+
+    def test_shards_merge_into_the_full_run(self):
+        run_main(self.path("full"), *self.ARGV)
+        for k in (1, 2, 3):
+            run_main(self.path("shards"), *self.ARGV, "--shard", f"{k}/3")
+        run_main(self.path("shards"), "--merge-shards", "3")
+        self.assertEqual(read_outputs(self.path("shards")), read_outputs(self.path("full")))
+
+    def test_merge_refuses_an_unfinished_shard(self):
+        for k in (1, 2):
+            run_main(self.path("shards"), *self.ARGV, "--shard", f"{k}/2")
+        manifest = self.path("shards/non_conformities.shard-02-of-02.checkpoint.jsonl")
+        with open(manifest, encoding='utf-8') as f:
+            lines = f.readlines()
+        with open(manifest, 'w', encoding='utf-8') as f:
+            f.writelines(lines[:-1])
+        with self.assertRaises(SystemExit):
+            run_main(self.path("shards"), "--merge-shards", "2")
+
+    def test_merge_needs_at_least_one_shard(self):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+            with self.assertRaises(SystemExit):
+                run_main(self.path("shards"), "--merge-shards", "0")
+        self.assertEqual(os.listdir(self.path("shards")), [])
+
+    def test_resume_after_a_crash(self):
+        run_main(self.path("full"), *self.ARGV)
+        self.run_crashing(self.path("resumed"), *self.ARGV)
+        entries, _, _ = gt.read_checkpoint(self.path("resumed/non_conformities.checkpoint.jsonl"))
+        self.assertTrue(0 < len(entries) < 24)
+        # The run seed comes from the checkpoint
+        run_main(self.path("resumed"), "--total-tickets", "24", "--text-backend", "template", "--resume")
+        self.assertEqual(read_outputs(self.path("resumed")), read_outputs(self.path("full")))
+
+    def test_generated_histories_follow_the_workflow(self):
+        for generation in ("per-stage", "whole-ticket"):
+            run_main(self.path(generation), *self.ARGV, "--generation", generation)
+            with open(self.path(f"{generation}/non_conformities.json"), encoding='utf-8') as f:
+                tickets = json.load(f)
+            self.assertEqual(len(tickets), 24)
+            for ticket in tickets:
+                self.assertIsNone(gt.validate_status_history(history_entries(ticket)), ticket["Ticket ID"])
+
+    def load(self, name):
+        with open(self.path(f"{name}/non_conformities.json"), encoding='utf-8') as f:
+            return {ticket["Ticket ID"]: ticket for ticket in json.load(f)}
+
+    def test_augment_keeps_the_existing_tickets(self):
+        argv = ("--seed", "11", "--text-backend", "template")
+        run_main(self.path("augmented"), "--total-tickets", "12", *argv)
+        before = self.load("augmented")
+        run_main(self.path("augmented"), "--total-tickets", "24", "--augment", *argv)
+        after = self.load("augmented")
+        self.assertEqual(len(after), 24)
+        for ticket_id, ticket in before.items():
+            self.assertEqual(after[ticket_id], ticket)
+        # Numbering continues after each category's last ID
+        for category_code in gt.categories:
+            numbers = sorted(int(ticket_id.rsplit("-", 1)[1]) for ticket_id in after if ticket_id.startswith(category_code + "-"))
+            self.assertEqual(numbers, list(range(1, len(numbers) + 1)))
+        # Nothing is missing at the same total
+        outputs = read_outputs(self.path("augmented"))
+        run_main(self.path("augmented"), "--total-tickets", "24", "--augment", *argv)
+        self.assertEqual(read_outputs(self.path("augmented")), outputs)
+
+    def test_augment_indexes_a_dataset_without_a_log(self):
+        argv = ("--seed", "11", "--text-backend", "template")
+        run_main(self.path("augmented"), "--total-tickets", "12", *argv)
+        before = self.load("augmented")
+        for name in os.listdir(self.path("augmented")):
+            if name != "non_conformities.json":
+                os.remove(self.path(f"augmented/{name}"))
+        run_main(self.path("augmented"), "--total-tickets", "16", "--augment", *argv)
+        after = self.load("augmented")
+        self.assertEqual(len(after), 16)
+        for ticket_id, ticket in before.items():
+            self.assertEqual(after[ticket_id], ticket)
+
+    def test_interrupted_augment_resumes_onto_the_same_tickets(self):
+        argv = ("--seed", "11", "--text-backend", "template")
+        for name in ("full", "resumed"):
+            run_main(self.path(name), "--total-tickets", "8", *argv)
+        run_main(self.path("full"), "--total-tickets", "24", "--augment", *argv)
+        self.run_crashing(self.path("resumed"), "--total-tickets", "24", "--augment", *argv)
+        run_main(self.path("resumed"), "--total-tickets", "24", "--augment", *argv)
+        self.assertEqual(read_outputs(self.path("resumed")), read_outputs(self.path("full")))
+
+
+class StatusHistoryTest(unittest.TestCase):
+
+    def valid_entries(self, num_actions=2):
+        entries = []
+        for status_info in gt.ticket_status_steps_prompts:
+            entries.append({"status": status_info["status"], "comment": "- done"})
+            if status_info["status"] in gt.per_action_statuses:
+                entries.extend(
+                    {"status": f"{status_info['status']} - Action {k}", "comment": "- done"}
+                    for k in range(1, num_actions + 1)
+                )
+        return entries
+
+    def test_accepts_a_run_of_the_workflow(self):
+        self.assertIsNone(gt.validate_status_history(self.valid_entries()))
+
+    def test_rejects_a_missing_mandatory_step(self):
+        mandatory = next(info["status"] for info in gt.ticket_status_steps_prompts if info["type"] != "optional")
+        entries = [entry for entry in self.valid_entries() if entry["status"] != mandatory]
+        self.assertIsNotNone(gt.validate_status_history(entries))
+
+    def test_rejects_too_many_recurrences(self):
+        recurring = next(info["status"] for info in gt.ticket_status_steps_prompts if info["recurrence"] == "many")
+        entries = self.valid_entries()
+        at = next(i for i, entry in enumerate(entries) if entry["status"] == recurring)
+        entries[at:at] = [{"status": recurring, "comment": "- again"}] * 3
+        self.assertIsNotNone(gt.validate_status_history(entries))
+
+    def test_rejects_mismatched_action_counts(self):
+        validation = gt.per_action_statuses[1]
+        entries = [entry for entry in self.valid_entries() if entry["status"] != f"{validation} - Action 2"]
+        self.assertIsNotNone(gt.validate_status_history(entries))
+
+    def test_rejects_trailing_and_empty_entries(self):
+        self.assertIsNotNone(gt.validate_status_history(self.valid_entries() + [{"status": "Open", "comment": "- x"}]))
+        entries = self.valid_entries()
+        entries[0] = dict(entries[0], comment=" ")
+        self.assertIsNotNone(gt.validate_status_history(entries))
+
+
+if __name__ == "__main__":
+    unittest.main()
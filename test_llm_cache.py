@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+from llm_cache import ResponseCache
+
+
+def request(text, temperature=0.7):
+    return {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": text}], "temperature": temperature}
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "cache.sqlite")
+
+    def open(self, **limits):
+        cache = ResponseCache(self.path, **limits)
+        self.addCleanup(cache.conn.close)
+        return cache
+
+    def age(self, cache, seconds, text):
+        # Moves an entry's timestamps `seconds` into the past
+        cache.conn.execute(
+            "UPDATE responses SET created_at = created_at - ?, last_access = last_access - ? WHERE content = ?",
+            (seconds, seconds, text)
+        )
+        cache.conn.commit()
+
+    def test_hit_and_miss(self):
+        cache = self.open()
+        self.assertIsNone(cache.get(request("a")))
+        cache.put(request("a"), "answer a")
+        self.assertEqual(cache.get(request("a")), "answer a")
+        # Any parameter is part of the key
+        self.assertIsNone(cache.get(request("a", temperature=0.2)))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_replays_across_runs(self):
+        cache = self.open()
+        cache.put(request("a"), "answer a")
+        cache.close()
+        self.assertEqual(self.open().get(request("a")), "answer a")
+
+    def test_expired_entries_miss_and_are_evicted(self):
+        cache = self.open(max_age=3600)
+        cache.put(request("old"), "old answer")
+        cache.put(request("new"), "new answer")
+        self.age(cache, 7200, "old answer")
+        self.assertIsNone(cache.get(request("old")))
+        self.assertEqual(cache.get(request("new")), "new answer")
+        cache.evict()
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_evicts_least_recently_used_beyond_max_bytes(self):
+        cache = self.open(max_bytes=25)
+        for name in ("a", "b", "c"):
+            cache.put(request(name), f"answer {name}.")
+            self.age(cache, 10, f"answer {name}.")
+        # Reading "a" makes "b" the least recently used entry
+        cache.get(request("a"))
+        cache.evict()
+        self.assertIsNone(cache.get(request("b")))
+        self.assertEqual(cache.get(request("a")), "answer a.")
+        self.assertEqual(cache.get(request("c")), "answer c.")
+        self.assertLessEqual(cache.stats()["bytes"], 25)
+
+
+if __name__ == "__main__":
+    unittest.main()
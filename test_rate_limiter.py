@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+
+import openai
+from openai import OpenAI, AsyncOpenAI
+
+from mock_openai_server import start_server
+from rate_limiter import RateLimitScheduler, TokenBucket, parse_duration
+
+
+def params(k):
+    return {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": f"Comment {k}"}], "max_tokens": 20}
+
+
+class RateLimitSchedulerTest(unittest.TestCase):
+
+    def start(self, **options):
+        server, base_url = start_server(latency_ms=1, latency_sigma=0.0, seed=4, **options)
+        self.addCleanup(server.shutdown)
+        return server, base_url
+
+    def test_parses_rate_limit_durations(self):
+        self.assertEqual(parse_duration("1m30s"), 90)
+        self.assertAlmostEqual(parse_duration("250ms"), 0.25)
+        self.assertIsNone(parse_duration(None))
+
+    def test_token_bucket_paces_beyond_its_burst(self):
+        bucket = TokenBucket(per_minute=60)
+        waits = [bucket.take(1) for _ in range(61)]
+        self.assertEqual(waits[:60], [0] * 60)
+        self.assertGreater(waits[60], 0)
+
+    def test_backoff_honours_retry_after_and_halves_concurrency(self):
+        # Injected 429s ask for a 500ms wait in retry-after-ms
+        server, base_url = self.start(rate_limit_error_rate=1.0)
+        with self.assertRaises(openai.RateLimitError) as caught:
+            OpenAI(base_url=base_url, api_key="mock", max_retries=0).chat.completions.create(**params(0))
+        scheduler = RateLimitScheduler(max_concurrency=8, base_delay=0.01)
+        self.assertGreaterEqual(scheduler.backoff(0, caught.exception), 0.5)
+        self.assertEqual(scheduler.limit, 4)
+        self.assertEqual(scheduler.stats["rate_limited"], 1)
+        # The wait is capped by max_delay
+        scheduler = RateLimitScheduler(base_delay=0.01, max_delay=0.1)
+        self.assertLessEqual(scheduler.backoff(0, caught.exception), 0.1)
+
+    def test_retries_injected_rate_limits(self):
+        server, base_url = self.start(rate_limit_error_rate=0.3)
+        create = OpenAI(base_url=base_url, api_key="mock", max_retries=0).chat.completions.with_raw_response.create
+        scheduler = RateLimitScheduler(base_delay=0.01, max_delay=0.02)
+        for k in range(30):
+            self.assertTrue(scheduler.call(create, params(k)).choices[0].message.content)
+        counts = server.state.counts
+        self.assertGreater(counts["rate_limited"], 0)
+        self.assertEqual(scheduler.stats["rate_limited"], counts["rate_limited"])
+        self.assertEqual(counts["requests"], 30 + scheduler.stats["retries"])
+
+    def test_gives_up_after_max_retries(self):
+        server, base_url = self.start(rate_limit_error_rate=1.0)
+        create = OpenAI(base_url=base_url, api_key="mock", max_retries=0).chat.completions.with_raw_response.create
+        scheduler = RateLimitScheduler(max_retries=2, base_delay=0.01, max_delay=0.02)
+        with self.assertRaises(openai.RateLimitError):
+            scheduler.call(create, params(0))
+        self.assertEqual(server.state.counts["requests"], 3)
+        self.assertEqual(scheduler.stats["failures"], 1)
+
+    def test_async_calls_retry_within_the_concurrency_limit(self):
+        server, base_url = self.start(rate_limit_error_rate=0.3)
+        scheduler = RateLimitScheduler(max_concurrency=4, base_delay=0.01, max_delay=0.02)
+
+        async def run():
+            async with AsyncOpenAI(base_url=base_url, api_key="mock", max_retries=0) as client:
+                create = client.chat.completions.with_raw_response.create
+                return await asyncio.gather(*(scheduler.acall(create, params(k)) for k in range(30)))
+
+        self.assertEqual(len(asyncio.run(run())), 30)
+        self.assertEqual(scheduler.in_flight, 0)
+        self.assertLess(scheduler.limit, 4)
+        self.assertEqual(server.state.counts["requests"], 30 + scheduler.stats["retries"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import generate_tickets as gt
+from scenario_planner import allocate_counts, plan_skeletons, slot_statuses, save_skeletons, load_skeletons
+
+
+class SkeletonPlanTest(unittest.TestCase):
+
+    def test_allocated_counts_add_up(self):
+        weights = [info["weight"] for info in gt.categories.values()]
+        for total in (1, 7, 10, 999):
+            counts = allocate_counts(total, weights)
+            self.assertEqual(sum(counts), total)
+            for count, weight in zip(counts, weights):
+                self.assertLess(abs(count - total * weight / sum(weights)), 1)
+
+    def test_planned_skeletons_follow_the_workflow(self):
+        steps = gt.ticket_status_steps_prompts
+        plan = plan_skeletons(500, gt.categories, steps, gt.per_action_statuses, 365, seed=3)
+        kinds = slot_statuses(steps, gt.per_action_statuses)
+        offsets = plan["offsets"]
+        self.assertEqual(len(offsets), 501)
+        for i in range(500):
+            codes = plan["slot_status"][offsets[i]:offsets[i + 1]]
+            days = plan["slot_day"][offsets[i]:offsets[i + 1]]
+            entries = [{"status": kinds[code][1], "comment": "- x"} for code in codes]
+            self.assertIsNone(gt.validate_status_history(entries), i)
+            self.assertTrue((days >= 0).all(), i)
+
+    def test_planned_skeletons_are_reproducible(self):
+        steps = gt.ticket_status_steps_prompts
+        first = plan_skeletons(100, gt.categories, steps, gt.per_action_statuses, 365, seed=5)
+        second = plan_skeletons(100, gt.categories, steps, gt.per_action_statuses, 365, seed=5)
+        for key in first:
+            self.assertTrue((first[key] == second[key]).all(), key)
+
+    def test_saved_skeletons_load_unchanged(self):
+        plan = plan_skeletons(50, gt.categories, gt.ticket_status_steps_prompts, gt.per_action_statuses, 365, seed=7)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "skeletons.npz")
+            save_skeletons(plan, path)
+            loaded = load_skeletons(path)
+        self.assertEqual(sorted(loaded), sorted(plan))
+        for key in plan:
+            self.assertTrue((loaded[key] == plan[key]).all(), key)
+
+
+if __name__ == "__main__":
+    unittest.main()
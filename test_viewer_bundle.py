@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import unittest
+
+from viewer_bundle import build_viewer_bundle, delta_encode, first_line, tokenize
+
+
+def make_ticket(i):
+    return {
+        "Ticket ID": f"{'MEC' if i % 2 else 'ELE'}-{i:04d}",
+        "Category": "Mechanical" if i % 2 else "Electrical",
+        "Open Date": "2024-02-01",
+        "Initial Description": f"- Torque out of limits on bracket {i}\n- Parts quarantined",
+        "Status History": [{"Status": "Open", "Date": "2024-02-01", "Comment": f"- opened {i}"}]
+    }
+
+
+def undelta(deltas):
+    ordinals = []
+    total = 0
+    for delta in deltas:
+        total += delta
+        ordinals.append(total)
+    return ordinals
+
+
+class ViewerBundleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.tickets = [make_ticket(i) for i in range(7)]
+        self.jsonl = os.path.join(self.tmp.name, "tickets.jsonl")
+        with open(self.jsonl, 'w', encoding='utf-8') as f:
+            for ticket in reversed(self.tickets):
+                f.write(json.dumps(ticket) + "\n")
+        self.out = os.path.join(self.tmp.name, "viewer")
+        ticket_ids = [ticket["Ticket ID"] for ticket in self.tickets]
+        self.assertEqual(build_viewer_bundle(self.jsonl, ticket_ids, self.out, page_size=3), 7)
+
+    def read(self, *parts):
+        with open(os.path.join(self.out, *parts), encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_helpers(self):
+        self.assertEqual(tokenize("MEC-0001: Torque_out of limits, a"), ["mec", "0001", "torque", "out", "of", "limits"])
+        self.assertEqual(first_line("\n  - # Torque out of limits\n- more"), "Torque out of limits")
+        self.assertEqual(delta_encode([2, 5, 9]), [2, 3, 4])
+
+    def test_index_and_summary_pages(self):
+        index = self.read("index.json")
+        self.assertEqual((index["count"], index["page_size"], index["pages"]), (7, 3, 3))
+        self.assertEqual(index["categories"], ["Electrical", "Mechanical"])
+        rows = [row for page in range(3) for row in self.read("summary", f"{page:05d}.json")]
+        self.assertEqual([row[0] for row in rows], [ticket["Ticket ID"] for ticket in self.tickets])
+        self.assertEqual(rows[1], ["MEC-0001", 1, "2024-02-01", "Torque out of limits on bracket 1"])
+
+    def test_tickets_are_stored_whole(self):
+        for ticket in self.tickets:
+            code = ticket["Ticket ID"].split("-")[0]
+            self.assertEqual(self.read("tickets", code, f"{ticket['Ticket ID']}.json"), ticket)
+
+    def test_search_index_finds_tickets(self):
+        index = self.read("index.json")
+        shard = self.read("search", "to.json")
+        self.assertIn("to", index["search_prefixes"])
+        self.assertEqual(undelta(shard["torque"]), list(range(7)))
+        self.assertEqual(undelta(self.read("search", "me.json")["mechanical"]), [1, 3, 5])
+
+    def test_rebuild_replaces_the_bundle(self):
+        build_viewer_bundle(self.jsonl, ["ELE-0000"], self.out, page_size=10)
+        self.assertEqual(self.read("index.json")["pages"], 1)
+        self.assertEqual(len(os.listdir(os.path.join(self.out, "summary"))), 1)
+        self.assertFalse(os.path.exists(self.out + ".tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
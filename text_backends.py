@@ -0,0 +1,249 @@
+import abc
+import json
+import random
+import re
+import zlib
+
+# A text backend answers the tagged requests yielded by the ticket workflows
+# (see tagged() in generate_tickets.py) with complete(request) -> str,
+# in place of the OpenAI API. The backends here are fully local.
+
+PHASES = [
+    "final assembly", "functional testing", "incoming inspection", "ground test",
+    "sub-assembly", "pre-delivery check", "system integration"
+]
+AREAS = [
+    "wing root", "fuselage section 3", "nose landing gear bay", "avionics bay", "cargo door frame",
+    "pylon attachment", "cockpit panel", "APU compartment", "horizontal stabilizer", "main landing gear"
+]
+MEASUREMENTS = [
+    ("torque", "Nm", 20, 120), ("gap", "mm", 0.1, 3.0), ("voltage", "V", 24, 30),
+    ("response time", "ms", 50, 900), ("resistance", "mOhm", 1, 50), ("temperature", "degC", 40, 140),
+    ("vibration", "mm/s", 1, 25), ("pressure", "bar", 100, 210)
+]
+REFERENCES = ["AMM 32-11-00", "SRM 51-10-02", "AS9100 8.7", "ISO 9001 8.7", "DO-178C", "ABD0100", "IPC 24-21-00"]
+
+# Bullet points per kind of stage, picked by keyword in the status
+STAGE_PHRASES = [
+    ("root-cause", [
+        "5-why analysis completed", "Ishikawa diagram reviewed with {area} team",
+        "Root cause linked to {hint_lower}", "Process gap identified at {phase}", "Contributing factor: operator training"
+    ]),
+    ("classification", [
+        "Impact assessed: {impact}", "Airworthiness impact evaluated", "No effect on delivered aircraft confirmed",
+        "Classification recorded per {reference}"
+    ]),
+    ("decision", [
+        "Corrective actions required", "Rework approved by MRB", "Containment extended to open work orders",
+        "Supplier notification issued"
+    ]),
+    ("plan definition", [
+        "Action plan drafted with owners and due dates", "Rework per {reference}", "Update work instruction",
+        "Add inspection step at {phase}"
+    ]),
+    ("execution", [
+        "Rework completed on {area}", "Work instruction updated", "Re-measured {quantity}: {value} {unit}, within limits",
+        "Team briefed on revised procedure", "Parts replaced and traced"
+    ]),
+    ("validation of corrective", [
+        "Effectiveness verified", "Re-inspection passed", "Evidence attached to ticket", "No recurrence over 3 batches"
+    ]),
+    ("closure", [
+        "All actions closed", "Documentation complete", "Lessons learned shared", "Ticket closed"
+    ]),
+    ("workpackage", [
+        "Analyses reviewed and signed", "Work package consistent with findings", "Signature applied"
+    ]),
+    ("validation", [
+        "Analysis validated", "Approach approved", "Additional check requested on {area}", "Findings consistent with data"
+    ]),
+    ("calculation", [
+        "Margin of safety recomputed: {margin}", "Load case reviewed at {area}", "Stress within allowables",
+        "FEM check on {area} completed", "Tolerance stack-up evaluated"
+    ]),
+    ("expertise", [
+        "Similar case reviewed in fleet history", "Specialist check on {area}", "Recommend extended inspection",
+        "Material properties confirmed", "Failure mode reviewed against {reference}"
+    ]),
+    ("analysis", [
+        "Possible cause: {hint_lower}", "Affected system around {area}", "Measured {quantity}: {value} {unit}",
+        "Immediate containment: quarantine affected parts", "Further checks at {phase}"
+    ]),
+    ("", [
+        "Status updated", "Reviewed with {area} team", "Reference {reference}"
+    ])
+]
+
+TOKEN_RE = re.compile(r"\n|[^ \n]+")
+
+
+def request_rng(request):
+    # Deterministic per request, so every engine produces the same text. The
+    # whole conversation is hashed: with the prefix layout the last message
+    # alone is the same for every ticket at a given stage.
+    content = "\n".join(message["content"] for message in request["params"]["messages"])
+    return random.Random(zlib.crc32(content.encode('utf-8')))
+
+
+def base_status(status):
+    return status.split(" - Action ")[0] if status else ""
+
+
+class LocalBackend(abc.ABC):
+    # Answers the classifier and structured requests locally; subclasses
+    # provide the free text of descriptions and comments.
+
+    def __init__(self, steps, per_action_statuses):
+        self.steps = steps
+        self.per_action_statuses = per_action_statuses
+
+    def complete(self, request):
+        rng = request_rng(request)
+        function = request.get("function")
+        tags = request.get("tags", {})
+        if function == "generate_description":
+            return self.description(tags, rng)
+        if function == "generate_comment":
+            comment = self.comment(tags, rng)
+            if "response_format" in request["params"]:
+                return json.dumps({
+                    "comment": comment, "complexity": rng.randint(1, 3), "action_plan_length": rng.randint(1, 5)
+                })
+            return comment
+        if function == "determine_complexity":
+            return str(rng.randint(1, 3))
+        if function == "determine_action_plan_length":
+            return str(rng.randint(1, 5))
+        if function == "determine_classification":
+            return json.dumps({"complexity": rng.randint(1, 3), "action_plan_length": rng.randint(1, 5)})
+        if function == "generate_whole_ticket":
+            return json.dumps(self.whole_ticket(tags, rng))
+        if function == "summarize_history":
+            # Keep the first bullet of every folded comment
+            text = request["params"]["messages"][-1]["content"]
+            return "\n".join(line for line in text.splitlines() if line.startswith("- "))[:2000]
+        return self.comment(tags, rng)
+
+    def whole_ticket(self, tags, rng):
+        complexity = rng.randint(1, 3)
+        num_actions = rng.randint(1, 5)
+        history = []
+        for step in self.steps:
+            if step["type"] == "optional" and rng.random() < 0.5:
+                continue
+            count = rng.randint(1, complexity) if step["recurrence"] == "many" else 1
+            for _ in range(count):
+                history.append({"status": step["status"], "comment": self.comment(dict(tags, status=step["status"]), rng)})
+            if step["status"] in self.per_action_statuses:
+                for k in range(num_actions):
+                    status = f"{step['status']} - Action {k+1}"
+                    history.append({"status": status, "comment": self.comment(dict(tags, status=status), rng)})
+        return {"description": self.description(tags, rng), "status_history": history}
+
+    @abc.abstractmethod
+    def description(self, tags, rng):
+        pass
+
+    @abc.abstractmethod
+    def comment(self, tags, rng):
+        pass
+
+
+class TemplateBackend(LocalBackend):
+    # Fills bullet-point templates from the category, the description hint
+    # and phrases matching the stage
+
+    def fields(self, tags, rng):
+        quantity, unit, low, high = rng.choice(MEASUREMENTS)
+        hint = tags.get("hint") or "non-conformity"
+        return {
+            "hint": hint,
+            "hint_lower": hint[0].lower() + hint[1:],
+            "category": tags.get("category") or "",
+            "phase": rng.choice(PHASES),
+            "area": rng.choice(AREAS),
+            "quantity": quantity,
+            "unit": unit,
+            "value": round(rng.uniform(low, high), 1),
+            "limit": round(rng.uniform(low, high), 1),
+            "reference": rng.choice(REFERENCES),
+            "impact": rng.choice(["minor", "major", "critical"]),
+            "margin": round(rng.uniform(-0.1, 0.8), 2)
+        }
+
+    def description(self, tags, rng):
+        f = self.fields(tags, rng)
+        return (
+            f"- {f['hint']} ({f['category']})\n"
+            f"- Detected during {f['phase']}, {f['area']}\n"
+            f"- Measured {f['quantity']}: {f['value']} {f['unit']} (limit {f['limit']} {f['unit']})\n"
+            f"- Reference: {f['reference']}\n"
+            f"- Parts quarantined pending analysis"
+        )
+
+    def comment(self, tags, rng):
+        f = self.fields(tags, rng)
+        status = base_status(tags.get("status")).lower()
+        for keyword, phrases in STAGE_PHRASES:
+            if keyword in status:
+                break
+        lines = rng.sample(phrases, min(len(phrases), rng.randint(2, 4)))
+        if tags.get("action"):
+            lines.insert(0, f"{tags['action']}")
+        return "\n".join(f"- {line.format(**f)}" for line in lines)
+
+
+class MarkovBackend(TemplateBackend):
+    # Word-level n-gram chains trained on a previously generated dataset:
+    # descriptions per category and comments per stage. Anything without
+    # training data falls back to the templates.
+
+    def __init__(self, steps, per_action_statuses, order=2, max_tokens=150):
+        super().__init__(steps, per_action_statuses)
+        self.order = order
+        self.max_tokens = max_tokens
+        self.chains = {}
+
+    def train(self, tickets):
+        for ticket in tickets:
+            self.add(("description", ticket["Category"]), ticket["Initial Description"])
+            for status in ticket["Status History"]:
+                self.add(("comment", base_status(status["Status"])), status["Comment"])
+        # Freeze the transition lists into tuples for faster sampling
+        for chain in self.chains.values():
+            for state, followers in chain.items():
+                chain[state] = tuple(followers)
+        return self
+
+    def add(self, key, text):
+        chain = self.chains.setdefault(key, {})
+        tokens = [None] * self.order + TOKEN_RE.findall(text) + [None]
+        for i in range(len(tokens) - self.order):
+            chain.setdefault(tuple(tokens[i:i + self.order]), []).append(tokens[i + self.order])
+
+    def walk(self, chain, rng):
+        state = (None,) * self.order
+        out = []
+        for _ in range(self.max_tokens):
+            token = rng.choice(chain[state])
+            if token is None:
+                break
+            out.append(token)
+            state = state[1:] + (token,)
+        return " ".join(out).replace(" \n ", "\n").replace("\n ", "\n").replace(" \n", "\n").strip()
+
+    def description(self, tags, rng):
+        chain = self.chains.get(("description", tags.get("category")))
+        return self.walk(chain, rng) if chain else super().description(tags, rng)
+
+    def comment(self, tags, rng):
+        chain = self.chains.get(("comment", base_status(tags.get("status"))))
+        return self.walk(chain, rng) if chain else super().comment(tags, rng)
+
+
+def load_tickets(path):
+    # Accepts the pretty-printed JSON array or the JSONL log
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
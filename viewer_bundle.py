@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import re
+import shutil
+
+from output_writers import iter_tickets_in_order
+
+# Static files read by the Svelte viewer:
+#   index.json              counts, page size, category names
+#   summary/NNNNN.json      pages of [ticket id, category index, open date, first line]
+#   tickets/<code>/<id>.json  one ticket with its status history, loaded on demand
+#   search/<prefix>.json    token -> delta-encoded ticket ordinals, one file per
+#                           two-character token prefix
+PAGE_SIZE = 1000
+PREFIX_LENGTH = 2
+FIRST_LINE_LENGTH = 120
+
+# Same rule as the viewer's tokenize(): runs of letters and digits, lowercased
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) >= PREFIX_LENGTH]
+
+
+def first_line(description):
+    for line in description.splitlines():
+        line = line.strip().lstrip("-*# ").strip()
+        if line:
+            return line[:FIRST_LINE_LENGTH]
+    return ""
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def delta_encode(ordinals):
+    previous = 0
+    deltas = []
+    for ordinal in ordinals:
+        deltas.append(ordinal - previous)
+        previous = ordinal
+    return deltas
+
+
+def build_viewer_bundle(jsonl_paths, ticket_ids, out_dir, page_size=PAGE_SIZE):
+    # Streams the JSONL log(s) into a viewer bundle in `ticket_ids` order. Only
+    # the current summary page and the token index are held in memory. The
+    # bundle is built next to `out_dir` and swapped in when complete.
+    tmp_dir = out_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    for sub in ("summary", "tickets", "search"):
+        os.makedirs(os.path.join(tmp_dir, sub))
+    categories = {}
+    postings = {}
+    page = []
+    pages = 0
+    count = 0
+    for ordinal, ticket in enumerate(iter_tickets_in_order(jsonl_paths, ticket_ids)):
+        ticket_id = ticket["Ticket ID"]
+        category = categories.setdefault(ticket["Category"], len(categories))
+        page.append([ticket_id, category, ticket["Open Date"], first_line(ticket["Initial Description"])])
+        if len(page) == page_size:
+            write_json(os.path.join(tmp_dir, "summary", f"{pages:05d}.json"), page)
+            page = []
+            pages += 1
+
+        code = ticket_id.rsplit("-", 1)[0]
+        ticket_dir = os.path.join(tmp_dir, "tickets", code)
+        if not os.path.isdir(ticket_dir):
+            os.makedirs(ticket_dir)
+        write_json(os.path.join(ticket_dir, f"{ticket_id}.json"), ticket)
+
+        for token in set(tokenize(" ".join((ticket_id, ticket["Category"], ticket["Initial Description"])))):
+            postings.setdefault(token, []).append(ordinal)
+        count += 1
+    if page:
+        write_json(os.path.join(tmp_dir, "summary", f"{pages:05d}.json"), page)
+        pages += 1
+
+    shards = {}
+    for token, ordinals in postings.items():
+        shards.setdefault(token[:PREFIX_LENGTH], {})[token] = delta_encode(ordinals)
+    for prefix, tokens in shards.items():
+        write_json(os.path.join(tmp_dir, "search", f"{prefix}.json"), tokens)
+
+    write_json(os.path.join(tmp_dir, "index.json"), {
+        "count": count,
+        "page_size": page_size,
+        "pages": pages,
+        "categories": list(categories),
+        "prefix_length": PREFIX_LENGTH,
+        "search_prefixes": sorted(shards)
+    })
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Svelte viewer bundle from a JSONL ticket log.")
+    parser.add_argument("jsonl", nargs="+", help="JSONL log(s) written by generate_tickets.py")
+    parser.add_argument("--out", default="viewer", help="Bundle directory, served next to the viewer")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="Tickets per summary page")
+    args = parser.parse_args()
+    count = build_viewer_bundle(args.jsonl, [], args.out, args.page_size)
+    print(f"Viewer bundle with {count} tickets saved to '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()